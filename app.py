@@ -1,6 +1,7 @@
 import streamlit as st
 import os
 import tempfile
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -10,7 +11,7 @@ from langchain_groq import ChatGroq
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_classic.chains import create_retrieval_chain
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 import pymupdf4llm 
@@ -72,6 +73,7 @@ with st.sidebar:
             st.warning("⚠️ API Key Required")
 
     mode = st.radio("Select Operation Mode", ["Academic Research (PDF/ArXiv)", "Market Intelligence (Web)", "Research History"])
+    deep_mode = st.toggle("Deep Summarization (map-reduce)", value=False, help="Summarize the whole paper / all articles in parallel chunks instead of a token-budgeted excerpt. Slower and uses more tokens.")
 
 # --- Session State ---
 if "vectorstore" not in st.session_state:
@@ -80,8 +82,32 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "user" not in st.session_state:
     st.session_state.user = None
+if "memory" not in st.session_state:
+    from conversation_memory import ConversationMemory
+    st.session_state.memory = ConversationMemory()
+
+# --- Tracing ---
+from tracing import span, start_run, run_breakdown, recent_runs, start_metrics_server
+if os.getenv("METRICS_PORT"):
+    start_metrics_server(int(os.getenv("METRICS_PORT")))
 
 # --- Helper Functions ---
+def set_vectorstore(vectorstore):
+    """
+    Switches the Analyst Chat to a new document and starts a fresh conversation,
+    so the previous document's summary and turns are not sent with new questions.
+    """
+    from conversation_memory import ConversationMemory
+    st.session_state.vectorstore = vectorstore
+    st.session_state.memory = ConversationMemory()
+    st.session_state.messages = []
+
+def show_run_breakdown(run_id):
+    rows = run_breakdown(run_id)
+    if rows:
+        st.bar_chart({r["stage"]: r["self_ms"] / 1000 for r in rows})
+        st.dataframe([{**r, "total_ms": round(r["total_ms"]), "self_ms": round(r["self_ms"])} for r in rows])
+
 def process_pdf(uploaded_file):
     with st.spinner("🧠 Ingesting Document..."):
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
@@ -147,7 +173,10 @@ else:
                 st.error(f"Error: {msg}")
 
     if api_key:
-        llm = ChatGroq(groq_api_key=api_key, model_name="llama-3.3-70b-versatile")
+        # All sessions share one key: every call goes through the process-wide rate limiter
+        from llm_governor import GovernedLLM, get_governor, estimate_tokens, is_rate_limit_error, PRIORITY_INTERACTIVE
+        chat_model = ChatGroq(groq_api_key=api_key, model_name="llama-3.3-70b-versatile")
+        llm = GovernedLLM(chat_model)
 
         # === ADMIN DASHBOARD ===
         if st.session_state.role == 'admin':
@@ -155,7 +184,7 @@ else:
                 st.subheader("🛡️ Admin Dashboard")
                 from db_client import get_all_usage, get_history, get_all_feedback
                 
-                tab_stats, tab_feedback = st.tabs(["Usage Stats", "User Feedback"])
+                tab_stats, tab_feedback, tab_queue, tab_traces = st.tabs(["Usage Stats", "User Feedback", "LLM Queue", "Pipeline Traces"])
                 
                 with tab_stats:
                     # Stats
@@ -184,6 +213,34 @@ else:
                         st.dataframe(feedback_data)
                     else:
                         st.info("No feedback yet.")
+
+                with tab_queue:
+                    st.markdown("### 🚦 Groq Rate Limiter (this server process)")
+                    queue_stats = get_governor().snapshot()
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("Queue Depth", queue_stats["queue_depth"], help=f"Peak: {queue_stats['max_queue_depth']}")
+                    col2.metric("In Flight", queue_stats["in_flight"])
+                    col3.metric("Avg Wait", f"{queue_stats['avg_wait_seconds']:.2f}s", help=f"Max: {queue_stats['max_wait_seconds']:.2f}s")
+                    col4.metric("429 Retries", queue_stats["retries"], help=f"Rate-limited responses: {queue_stats['rate_limited']}, failed calls: {queue_stats['failures']}")
+                    st.json(queue_stats)
+
+                with tab_traces:
+                    st.markdown("### ⏱️ Recent Pipeline Runs (this server process)")
+                    runs = recent_runs()
+                    if runs:
+                        st.dataframe([{
+                            "run": r["name"],
+                            "topic": r["attributes"].get("topic"),
+                            "started": datetime.fromtimestamp(r["start"]).strftime("%Y-%m-%d %H:%M:%S"),
+                            "seconds": round(r["duration_ms"] / 1000, 1),
+                            "status": r["status"],
+                        } for r in runs])
+                        labels = {r["run_id"]: f"{r['name']}: {r['attributes'].get('topic')} ({r['duration_ms'] / 1000:.1f}s)" for r in runs}
+                        selected_run = st.selectbox("Run", list(labels), format_func=labels.get)
+                        show_run_breakdown(selected_run)
+                    else:
+                        st.info("No runs traced yet.")
+                    st.caption("Set TRACE_FILE to also log spans as JSONL, and METRICS_PORT to expose Prometheus metrics at /metrics.")
                 
                 st.stop() # Stop execution here if in Admin Mode
 
@@ -196,7 +253,7 @@ else:
             with tab1:
                 uploaded_file = st.file_uploader("Upload Research Paper", type="pdf")
                 if uploaded_file and st.button("Analyze PDF"):
-                    st.session_state.vectorstore = process_pdf(uploaded_file)
+                    set_vectorstore(process_pdf(uploaded_file))
                     st.success("Brain Built! Ready for Q&A.")
 
             with tab2:
@@ -204,31 +261,24 @@ else:
                 topic = st.text_input("Enter Research Topic:")
                 
                 if st.button("Start Autonomous Research"):
-                    with st.spinner("🔍 Searching & Analyzing..."):
+                    with st.spinner("🔍 Searching & Analyzing..."), start_run("academic", topic=topic) as run:
                         papers = search_arxiv(topic)
                         best_paper = select_best_paper(topic, papers, llm)
                         
                         md_text, image_dir = fetch_and_parse_rich_arxiv(best_paper['id'])
+
+                        # Thumbnail stage: small previews are generated once and cached next to the originals
+                        from image_tools import prepare_gallery
+                        gallery = prepare_gallery(image_dir)
                         
-                        # Presentation
+                        # Presentation (chart data from the paper's own tables, else from the same call)
                         with st.spinner("💡 Generating Presentation..."):
-                            presentation_prompt = (
-                                f"Create a structured presentation summary:\n\n{md_text[:10000]}\n\n"
-                                "Format as:\n# [Title]\n## Key Findings\n- [Point]\n## Methodology\n- [Point]\n## Conclusion\n- [Point]\n\n"
-                                "IMPORTANT: Include any specific statistics, numbers, or data points found in the text."
-                            )
-                            response = llm.invoke(presentation_prompt)
-                            presentation = response.content
-                            
-                            # Log Usage
-                            from db_client import log_usage
-                            usage = response.response_metadata.get('token_usage', {})
-                            log_usage(st.session_state.user.user.id, "llama-3.3-70b", usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), access_token)
-
-                            # Data Viz for Academic
-                            from viz_tools import extract_data_for_chart
-                            with st.spinner("📊 analyzing for charts..."):
-                                chart_data = extract_data_for_chart(presentation, llm, st.session_state.user.user.id, access_token)
+                            from research_tools import generate_presentation
+                            from viz_tools import extract_chart_data_locally, resolve_chart_data
+                            chart_data = extract_chart_data_locally(md_text)
+                            presentation = generate_presentation(md_text, llm, st.session_state.user.user.id, access_token, chart_section=not chart_data, topic=topic, map_reduce=deep_mode)
+                            if not chart_data:
+                                presentation, chart_data = resolve_chart_data(presentation, llm, st.session_state.user.user.id, access_token)
 
                             # Save to DB
                             from db_client import save_report
@@ -236,7 +286,7 @@ else:
                             
                             # Build Brain
                             from rag_engine import build_vector_store
-                            st.session_state.vectorstore = build_vector_store(md_text)
+                            set_vectorstore(build_vector_store(md_text))
 
                             # SAVE STATE
                             st.session_state.current_report = {
@@ -245,8 +295,12 @@ else:
                                 "title": best_paper['title'],
                                 "content": presentation,
                                 "chart_data": chart_data,
-                                "image_dir": image_dir
+                                "image_dir": image_dir,
+                                "gallery": gallery,
+                                "run_id": run.run_id
                             }
+                            st.session_state.gallery_page = 1
+                            st.session_state.gallery_focus = None
 
                 # DISPLAY STATE (if exists and matches mode)
                 if st.session_state.get("current_report") and st.session_state.current_report["mode"] == "Academic":
@@ -258,55 +312,81 @@ else:
                     st.markdown(report['content'])
                     st.markdown('</div>', unsafe_allow_html=True)
                     
+                    fig = None
                     if report['chart_data']:
                         from viz_tools import create_chart
                         fig = create_chart(report['chart_data'])
                         if fig:
                             st.plotly_chart(fig, use_container_width=True)
 
-                    # Export for Academic
+                    # Export for Academic (figures are downscaled and cached once per image)
                     from report_generator import generate_pdf, generate_docx
+                    from image_tools import collect_report_images
+                    from viz_tools import render_chart_image
+                    export_images = collect_report_images(report['image_dir'])
+                    chart_image = render_chart_image(fig)
                     col1, col2 = st.columns(2)
                     with col1:
-                        pdf_path = generate_pdf(report['content'])
+                        pdf_path = generate_pdf(report['content'], images=export_images, chart_image=chart_image)
                         with open(pdf_path, "rb") as f:
                             st.download_button("📥 Download PDF", f, file_name=f"{report['topic']}_academic.pdf")
                     with col2:
-                        docx_path = generate_docx(report['content'])
+                        docx_path = generate_docx(report['content'], images=export_images, chart_image=chart_image)
                         with open(docx_path, "rb") as f:
                             st.download_button("📝 Download Word", f, file_name=f"{report['topic']}_academic.docx")
 
-                    # Visuals
+                    # Visuals (previews only; the full-resolution file is sent when requested)
                     st.subheader("📊 Extracted Visuals")
-                    if os.path.exists(report['image_dir']):
-                        images = [f for f in os.listdir(report['image_dir']) if f.endswith(".png")]
-                        if images:
-                            cols = st.columns(3)
-                            for i, img_file in enumerate(images):
-                                with cols[i % 3]:
-                                    st.image(os.path.join(report['image_dir'], img_file), caption=img_file, use_container_width=True)
+                    gallery = report.get("gallery") or []
+                    if gallery:
+                        if st.session_state.get("gallery_focus"):
+                            st.image(st.session_state.gallery_focus, caption=os.path.basename(st.session_state.gallery_focus), use_container_width=True)
+                            if st.button("✖️ Close full size"):
+                                st.session_state.gallery_focus = None
+                                st.rerun()
+
+                        per_page = 9
+                        total_pages = (len(gallery) + per_page - 1) // per_page
+                        page = st.number_input("Page", min_value=1, max_value=total_pages, key="gallery_page") if total_pages > 1 else 1
+                        page_items = gallery[(page - 1) * per_page:page * per_page]
+
+                        cols = st.columns(3)
+                        for i, item in enumerate(page_items):
+                            with cols[i % 3]:
+                                st.image(item["preview"], caption=item["name"], use_container_width=True)
+                                if st.button("🔍 Full size", key=f"gallery_full_{item['name']}"):
+                                    st.session_state.gallery_focus = item["original"]
+                                    st.rerun()
+
+                        preview_kb = sum(item["preview_bytes"] for item in page_items) / 1024
+                        original_kb = sum(item["original_bytes"] for item in page_items) / 1024
+                        st.caption(f"Page payload: {preview_kb:,.0f} KB of previews vs {original_kb:,.0f} KB of originals ({len(gallery)} unique figures).")
                     
+                    if report.get("run_id"):
+                        with st.expander("⏱️ Timing breakdown"):
+                            show_run_breakdown(report["run_id"])
+
                     st.success("Brain Built! Ready for Q&A.")
 
         # === MODE 2: MARKET INTELLIGENCE ===
         elif mode == "Market Intelligence (Web)":
             st.subheader("🌐 Real-Time Market Analysis")
             from market_tools import search_market, generate_market_report
-            from viz_tools import extract_data_for_chart, create_chart
+            from viz_tools import resolve_chart_data, create_chart, render_chart_image
             from report_generator import generate_pdf, generate_docx
             
             topic = st.text_input("Enter Market/Industry:")
             if st.button("Generate Intelligence Report"):
-                with st.spinner("🕵️‍♂️ Scouting the Web..."):
-                    articles = search_market(topic)
+                with st.spinner("🕵️‍♂️ Scouting the Web..."), start_run("market", topic=topic) as run:
+                    articles = search_market(topic, max_results=15 if deep_mode else 5)
                     if articles:
                         st.write(f"Found {len(articles)} relevant sources.")
                         
-                        report_content = generate_market_report(topic, articles, llm, st.session_state.user.user.id) 
+                        report_content = generate_market_report(topic, articles, llm, st.session_state.user.user.id, map_reduce=deep_mode) 
                         
-                        # Data Viz
+                        # Data Viz (uses the report's own chart section, extraction call only as fallback)
                         with st.spinner("📊 Generating Charts..."):
-                            chart_data = extract_data_for_chart(report_content, llm, st.session_state.user.user.id, access_token)
+                            report_content, chart_data = resolve_chart_data(report_content, llm, st.session_state.user.user.id, access_token)
                         
                         # Save to DB
                         from db_client import save_report
@@ -314,14 +394,15 @@ else:
                         
                         # Enable Chat on this report
                         from rag_engine import build_vector_store
-                        st.session_state.vectorstore = build_vector_store(report_content)
+                        set_vectorstore(build_vector_store(report_content))
                         
                         # SAVE STATE
                         st.session_state.current_report = {
                             "mode": "Market",
                             "topic": topic,
                             "content": report_content,
-                            "chart_data": chart_data
+                            "chart_data": chart_data,
+                            "run_id": run.run_id
                         }
                     else:
                         st.error("No articles found.")
@@ -334,22 +415,28 @@ else:
                 st.markdown(report['content'])
                 st.markdown('</div>', unsafe_allow_html=True)
                 
+                fig = None
                 if report['chart_data']:
                     fig = create_chart(report['chart_data'])
                     if fig:
                         st.plotly_chart(fig, use_container_width=True)
                 
                 # Export
+                chart_image = render_chart_image(fig)
                 col1, col2 = st.columns(2)
                 with col1:
-                    pdf_path = generate_pdf(report['content'])
+                    pdf_path = generate_pdf(report['content'], chart_image=chart_image)
                     with open(pdf_path, "rb") as f:
                         st.download_button("📥 Download PDF", f, file_name=f"{report['topic']}_report.pdf")
                 with col2:
-                    docx_path = generate_docx(report['content'])
+                    docx_path = generate_docx(report['content'], chart_image=chart_image)
                     with open(docx_path, "rb") as f:
                         st.download_button("📝 Download Word", f, file_name=f"{report['topic']}_report.docx")
 
+                if report.get("run_id"):
+                    with st.expander("⏱️ Timing breakdown"):
+                        show_run_breakdown(report["run_id"])
+
                 st.success("Context Loaded! Ask questions about the report.")
 
         # === MODE 3: HISTORY ===
@@ -375,6 +462,10 @@ else:
                 with st.chat_message(message["role"]):
                     st.markdown(message["content"])
 
+            if len(st.session_state.memory.turn_stats) > 1:
+                with st.expander("📏 Prompt tokens per turn"):
+                    st.line_chart([t["total_tokens"] for t in st.session_state.memory.turn_stats])
+
             if prompt := st.chat_input("Ask follow-up questions..."):
                 st.session_state.messages.append({"role": "user", "content": prompt})
                 with st.chat_message("user"):
@@ -382,23 +473,51 @@ else:
 
                 with st.chat_message("assistant"):
                     try:
+                        memory = st.session_state.memory
+                        chat_llm = GovernedLLM(chat_model, priority=PRIORITY_INTERACTIVE)
+
+                        # Follow-ups ("and its accuracy?") are rewritten so retrieval sees the full question
+                        standalone_question = memory.condense_question(prompt, chat_llm)
+                        chat_history = memory.history_messages()
+
                         retriever = st.session_state.vectorstore.as_retriever()
                         system_prompt = (
                             "You are an expert analyst. Answer based on the provided context.\n\n"
+                            "Summary of the earlier conversation: {summary}\n\n"
                             "Context: {context}"
                         )
                         prompt_template = ChatPromptTemplate.from_messages([
                             ("system", system_prompt),
+                            MessagesPlaceholder("chat_history"),
                             ("human", "{input}"),
                         ])
-                        chain = create_stuff_documents_chain(llm, prompt_template)
+                        chain = create_stuff_documents_chain(chat_model, prompt_template)
                         rag_chain = create_retrieval_chain(retriever, chain)
                         
-                        response = rag_chain.invoke({"input": prompt})
+                        # Interactive priority: served ahead of queued report generation
+                        chain_input = {"input": standalone_question, "chat_history": chat_history, "summary": memory.summary or "(none)"}
+                        with span("chat", history_messages=len(chat_history)):
+                            response = get_governor().call(
+                                rag_chain.invoke, chain_input,
+                                priority=PRIORITY_INTERACTIVE,
+                                estimated_tokens=estimate_tokens({"input": standalone_question, "summary": memory.summary}) + memory.max_history_tokens + 1500, # + retrieved context
+                            )
                         st.markdown(response["answer"])
                         st.session_state.messages.append({"role": "assistant", "content": response["answer"]})
+
+                        turn = memory.record_turn(standalone_question, response.get("context", []))
+                        memory.add("user", prompt)
+                        memory.add("assistant", response["answer"])
+                        memory.update_summary(chat_llm)
+                        st.caption(
+                            f"Prompt ≈ {turn['total_tokens']:,} tokens (context {turn['context_tokens']:,}, "
+                            f"history {turn['history_tokens']:,}, summary {turn['summary_tokens']:,})"
+                        )
                     except Exception as e:
-                        st.error(f"Error: {e}")
+                        if is_rate_limit_error(e):
+                            st.warning("⏳ The analyst desk is busy right now (LLM rate limit). Please try again in a minute.")
+                        else:
+                            st.error(f"Error: {e}")
 
     else:
         st.info("👈 Please enter your Groq API Key to start.")
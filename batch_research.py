@@ -0,0 +1,270 @@
+"""
+Headless batch runner: researches every topic (or arXiv ID) listed in a file.
+
+    python batch_research.py topics.txt --mode academic --workers 3
+    python batch_research.py markets.txt --mode market --save
+
+Completed items are appended to a JSONL checkpoint, so re-running the same command
+after a crash skips them and continues with the rest.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ARXIV_ID_RE = re.compile(r"^(\d{4}\.\d{4,5}|[a-z\-]+(\.[A-Z]{2})?/\d{7})(v\d+)?$")
+
+class _CountingLLM:
+    """
+    Wraps the shared LLM for one item so its token usage can be reported separately.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, *args, **kwargs):
+        response = self.llm.invoke(*args, **kwargs)
+        usage = (getattr(response, "response_metadata", None) or {}).get('token_usage', {})
+        with self._lock:
+            self.prompt_tokens += usage.get('prompt_tokens', 0)
+            self.completion_tokens += usage.get('completion_tokens', 0)
+        return response
+
+class SupabaseSession:
+    """
+    Signs the batch run in as a regular user so saved reports pass the research_reports
+    RLS policy (auth.uid() = user_id). Signs in again shortly before the access token expires.
+    """
+
+    def __init__(self, email: str, password: str):
+        self.email = email
+        self._password = password
+        self._lock = threading.Lock()
+        self._sign_in()
+
+    def _sign_in(self):
+        from db_client import sign_in
+        response = sign_in(self.email, self._password)
+        if not response or not getattr(response, "session", None):
+            raise RuntimeError(f"Could not sign in to Supabase as {self.email}.")
+        self.user_id = response.user.id
+        self._access_token = response.session.access_token
+        self._expires_at = getattr(response.session, "expires_at", None) or time.time() + 3600
+
+    def credentials(self):
+        """
+        Returns (user_id, access_token) for db_client calls.
+        """
+        with self._lock:
+            if time.time() > self._expires_at - 120:
+                self._sign_in()
+            return self.user_id, self._access_token
+
+def read_items(path: str) -> list:
+    """
+    One topic or arXiv ID per line; blank lines and '#' comments are ignored, duplicates dropped.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            item = line.strip()
+            if item and not item.startswith("#") and item not in items:
+                items.append(item)
+    return items
+
+def load_checkpoint(path: str) -> dict:
+    """
+    Returns the latest checkpoint record per item.
+    """
+    records = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # Partially written line from a crash
+                records[record["item"]] = record
+    return records
+
+def _slug(text: str) -> str:
+    """
+    Readable, unique file name stem: "AI/ML" and "AI ML" share a slug but not the hash suffix.
+    """
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:8]
+    return f"{re.sub(r'[^a-zA-Z0-9]+', '_', text).strip('_')[:80] or 'item'}_{digest}"
+
+def research_item(item: str, mode: str, llm, map_reduce: bool = False):
+    """
+    Runs the same pipeline as the UI for one topic. Returns (title, report_markdown, chart_data).
+    """
+    from viz_tools import resolve_chart_data
+
+    if mode == "market":
+        from market_tools import search_market, generate_market_report
+        # Same article count as the UI's deep mode when summarizing with map-reduce
+        articles = search_market(item, max_results=15 if map_reduce else 5)
+        if not articles:
+            raise RuntimeError("No articles found.")
+        report = generate_market_report(item, articles, llm, map_reduce=map_reduce)
+        report, chart_data = resolve_chart_data(report, llm)
+        return item, report, chart_data
+
+    from research_tools import search_arxiv, select_best_paper, fetch_and_parse_rich_arxiv, generate_presentation
+    from viz_tools import extract_chart_data_locally
+
+    if ARXIV_ID_RE.match(item):
+        paper = {"id": item, "title": item}
+        topic = None
+    else:
+        papers = search_arxiv(item)
+        if not papers:
+            raise RuntimeError("No papers found.")
+        paper = select_best_paper(item, papers, llm)
+        topic = item
+
+    md_text, _ = fetch_and_parse_rich_arxiv(paper['id'])
+    chart_data = extract_chart_data_locally(md_text)
+    presentation = generate_presentation(md_text, llm, chart_section=not chart_data, topic=topic, map_reduce=map_reduce)
+    if not chart_data:
+        presentation, chart_data = resolve_chart_data(presentation, llm)
+    return paper['title'], presentation, chart_data
+
+def run_batch(items: list, mode: str, llm, workers: int = 3, checkpoint_path: str = "batch_checkpoint.jsonl",
+              output_dir: str = "batch_reports", session: SupabaseSession = None, retry_failed: bool = True,
+              map_reduce: bool = False) -> dict:
+    """
+    Processes items with at most `workers` in parallel, checkpointing each result.
+    With a session, every report is also saved to Supabase and an item only counts as done once the save succeeded.
+    Returns the throughput summary.
+    """
+    from db_client import save_report
+
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_checkpoint(checkpoint_path)
+    skip_statuses = {"done"} if retry_failed else {"done", "failed"}
+    pending = [item for item in items if previous.get(item, {}).get("status") not in skip_statuses]
+    print(f"📋 {len(items)} items, {len(items) - len(pending)} already in checkpoint, {len(pending)} to run.")
+
+    checkpoint_lock = threading.Lock()
+    results = []
+
+    def process(item: str) -> dict:
+        counting_llm = _CountingLLM(llm)
+        start = time.perf_counter()
+        record = {"item": item, "mode": mode}
+        try:
+            title, report, chart_data = research_item(item, mode, counting_llm, map_reduce)
+            output_path = os.path.join(output_dir, f"{_slug(item)}.md")
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(report)
+            record["output"] = output_path
+            if session:
+                user_id, access_token = session.credentials()
+                if not save_report(item, "Academic" if mode == "academic" else "Market", report, user_id, access_token):
+                    raise RuntimeError("Report written locally but could not be saved to Supabase.")
+            record.update({"status": "done", "title": title, "chart_data": chart_data})
+        except Exception as e:
+            print(f"❌ {item}: {e}")
+            record.update({"status": "failed", "error": str(e)})
+        record.update({
+            "seconds": round(time.perf_counter() - start, 2),
+            "prompt_tokens": counting_llm.prompt_tokens,
+            "completion_tokens": counting_llm.completion_tokens,
+        })
+        with checkpoint_lock:
+            with open(checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(process, item) for item in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            results.append(record)
+            icon = "✅" if record["status"] == "done" else "❌"
+            print(f"{icon} [{len(results)}/{len(pending)}] {record['item']} ({record['seconds']}s)")
+    elapsed = time.perf_counter() - start
+
+    done = [r for r in results if r["status"] == "done"]
+    failed = [r for r in results if r["status"] == "failed"]
+    return {
+        "items": len(items),
+        "skipped": len(items) - len(pending),
+        "done": len(done),
+        "failed": len(failed),
+        "elapsed_seconds": round(elapsed, 1),
+        "topics_per_hour": round(len(done) / elapsed * 3600, 1) if elapsed and done else 0.0,
+        "avg_seconds_per_topic": round(sum(r["seconds"] for r in done) / len(done), 1) if done else 0.0,
+        "prompt_tokens": sum(r["prompt_tokens"] for r in results),
+        "completion_tokens": sum(r["completion_tokens"] for r in results),
+        "failures": {r["item"]: r["error"] for r in failed},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch research: run many topics or arXiv IDs from a file.")
+    parser.add_argument("input", help="Text file with one topic or arXiv ID per line")
+    parser.add_argument("--mode", choices=["academic", "market"], default="academic")
+    parser.add_argument("--workers", type=int, default=3, help="Items processed in parallel (LLM calls are still rate limited)")
+    parser.add_argument("--checkpoint", default="batch_checkpoint.jsonl", help="JSONL file used to resume interrupted runs")
+    parser.add_argument("--output-dir", default="batch_reports", help="Where the Markdown reports are written")
+    parser.add_argument("--save", action="store_true",
+                        help="Also save each report to Supabase as the user given by --email / SUPABASE_EMAIL and SUPABASE_PASSWORD")
+    parser.add_argument("--email", help="Supabase account the reports are saved under (default: SUPABASE_EMAIL)")
+    parser.add_argument("--skip-failed", action="store_true", help="Do not retry items that failed in a previous run")
+    parser.add_argument("--map-reduce", action="store_true", help="Summarize full papers/articles with map-reduce")
+    parser.add_argument("--summary", help="Write the throughput summary to this JSON file")
+    args = parser.parse_args()
+
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        parser.error("GROQ_API_KEY is not set.")
+
+    session = None
+    if args.save:
+        email = args.email or os.getenv("SUPABASE_EMAIL")
+        password = os.getenv("SUPABASE_PASSWORD")
+        if not email or not password:
+            parser.error("--save needs a Supabase account: set SUPABASE_EMAIL (or --email) and SUPABASE_PASSWORD.")
+        try:
+            session = SupabaseSession(email, password)
+        except RuntimeError as e:
+            parser.error(str(e))
+
+    from langchain_groq import ChatGroq
+    from llm_governor import GovernedLLM, PRIORITY_BATCH
+    llm = GovernedLLM(ChatGroq(groq_api_key=api_key, model_name="llama-3.3-70b-versatile"), priority=PRIORITY_BATCH)
+
+    summary = run_batch(
+        read_items(args.input), args.mode, llm,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        output_dir=args.output_dir,
+        session=session,
+        retry_failed=not args.skip_failed,
+        map_reduce=args.map_reduce,
+    )
+
+    print("\n📈 Batch summary")
+    for key, value in summary.items():
+        if key != "failures":
+            print(f"  {key}: {value}")
+    for item, error in summary["failures"].items():
+        print(f"  ❌ {item}: {error}")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+End-to-end pipeline benchmark that runs fully offline.
+
+    python -m benchmarks.run_benchmarks --repeats 5 --output bench_results.json
+    python -m benchmarks.run_benchmarks --compare bench_results.json
+
+Every stage (arXiv search, paper selection, parse, chunk, embed, index build, retrieval,
+report generation, export, DB writes) is timed against local stand-ins (see benchmarks/fakes.py),
+so results are comparable across commits and machines; --compare prints the change against a saved run.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+
+from benchmarks.fakes import FakeLLM, offline_services, embedding_model_cached, EMBEDDING_MODEL
+
+PAPER_ID = "2401.00001"
+QUERIES = [
+    "What accuracy does the proposed method reach?",
+    "How long does the index take to build?",
+    "Which datasets were used in the evaluation?",
+    "What are the limitations of the approach?",
+]
+
+def make_sample_paper(path: str, pages: int = 12, figures: int = 6, seed: int = 7):
+    """
+    Writes a deterministic paper-like PDF: sections of text, a bordered results table and figures.
+    """
+    from fpdf import FPDF
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    words = ("retrieval model accuracy latency index corpus encoder chunk section baseline "
+             "dataset evaluation training transformer dense sparse benchmark throughput").split()
+
+    def paragraph(n=90):
+        return " ".join(rng.choice(words) for _ in range(n)).capitalize() + "."
+
+    image_dir = tempfile.mkdtemp(prefix="bench_figures_")
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    sections = ["Abstract", "1 Introduction", "2 Related Work", "3 Method", "4 Experiments", "5 Results", "6 Conclusion", "References"]
+    for page in range(pages):
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, sections[page % len(sections)], 0, 1)
+        pdf.set_font("Arial", size=11)
+        for _ in range(3):
+            pdf.multi_cell(0, 6, paragraph())
+        if page == 5:
+            pdf.set_font("Arial", "B", 11)
+            pdf.cell(0, 8, "Table 2: Accuracy on benchmarks", 0, 1)
+            pdf.set_font("Arial", size=11)
+            for row in [("Model", "Params", "Accuracy (%)"), ("BERT", "110M", "84.2"), ("RoBERTa", "125M", "87.1"), ("Ours", "120M", "89.4")]:
+                for cell in row:
+                    pdf.cell(50, 8, cell, 1, 0)
+                pdf.ln()
+        if page < figures:
+            image = Image.new("RGB", (1400, 900), "white")
+            draw = ImageDraw.Draw(image)
+            for _ in range(150):
+                x, y = rng.randint(0, 1400), rng.randint(0, 900)
+                draw.line([x, y, x + rng.randint(-150, 150), y + rng.randint(-150, 150)],
+                          fill=(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)), width=3)
+            image_path = os.path.join(image_dir, f"figure_{page}.png")
+            image.save(image_path)
+            pdf.image(image_path, w=120)
+    pdf.output(path)
+    shutil.rmtree(image_dir, ignore_errors=True)
+
+def _time(fn, repeats: int, setup=None):
+    """
+    Runs fn `repeats` times (after an optional per-run setup) and returns (timings_ms, last_result).
+    """
+    timings, result = [], None
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, result
+
+def _time_spans(fn, repeats: int, setup=None):
+    """
+    Like _time, but runs each repeat as a traced run and also returns the per-span
+    timings recorded inside it: (timings_ms, {span_name: timings_ms}, last_result).
+    """
+    import tracing
+
+    timings, span_timings, result = [], {}, None
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        with tracing.start_run("benchmark") as run:
+            result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        for row in tracing.run_breakdown(run.run_id):
+            if row["stage"] != "benchmark":
+                span_timings.setdefault(row["stage"], []).append(row["total_ms"])
+    return timings, span_timings, result
+
+def _summarize(timings: list) -> dict:
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "runs": len(timings),
+    }
+
+def run_benchmarks(repeats: int = 3, llm_latency: float = 0.0, embeddings: str = "auto") -> dict:
+    """
+    embeddings: "real" times the production all-MiniLM-L6-v2 model on CPU, "fake" uses
+    hash-based vectors (only the FAISS/plumbing cost is measured), "auto" picks real when cached.
+    """
+    import db_client
+    import rag_engine
+    import image_tools
+    import research_tools
+    import market_tools
+    import report_generator
+    import viz_tools
+    import context_packer
+
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    pdf_path = os.path.join(work_dir, "fixture.pdf")
+    make_sample_paper(pdf_path)
+    paper_root = os.path.join(work_dir, "paper_content")
+    llm = FakeLLM(latency=llm_latency)
+    stages, meta = {}, {}
+    real_embeddings = embeddings == "real" or (embeddings == "auto" and embedding_model_cached())
+    if not real_embeddings:
+        print("⚠️ Using fake embeddings: embed/retrieval timings do not reflect the production model.")
+    meta["embeddings"] = EMBEDDING_MODEL if real_embeddings else "DeterministicFakeEmbedding(384)"
+
+    with offline_services(pdf_path, real_embeddings=real_embeddings) as supabase:
+        # Search + LLM paper selection (arXiv client and LLM are local fakes)
+        timings, papers = _time(lambda: research_tools.search_arxiv("efficient retrieval"), repeats)
+        stages["arxiv_search"] = _summarize(timings)
+        timings, paper = _time(lambda: research_tools.select_best_paper("efficient retrieval", papers, llm), repeats)
+        stages["select_paper"] = _summarize(timings)
+        meta["selected_paper"] = paper["id"]
+
+        # Parse: download (served locally) + pymupdf4llm layout parsing and image extraction
+        def reset_paper():
+            shutil.rmtree(paper_root, ignore_errors=True)
+        timings, (md_text, image_dir) = _time(
+            lambda: research_tools.fetch_and_parse_rich_arxiv(PAPER_ID, output_dir=paper_root), repeats, setup=reset_paper)
+        stages["parse"] = _summarize(timings)
+        meta["markdown_chars"] = len(md_text)
+
+        def reset_thumbs():
+            shutil.rmtree(os.path.join(image_dir, image_tools.THUMB_DIR_NAME), ignore_errors=True)
+        timings, gallery = _time(lambda: image_tools.prepare_gallery(image_dir), repeats, setup=reset_thumbs)
+        stages["thumbnails_cold"] = _summarize(timings)
+        stages["thumbnails_cached"] = _summarize(_time(lambda: image_tools.prepare_gallery(image_dir), repeats)[0])
+        meta["figures"] = len(gallery)
+
+        if real_embeddings:
+            # Load once up front so the first vector_store repeat does not include it
+            stages["embedding_model_load"] = _summarize(_time(rag_engine.get_embeddings, 1)[0])
+
+        # The app's own code path; chunk/embed/index_build come from its spans
+        timings, span_timings, vectorstore = _time_spans(lambda: rag_engine.build_vector_store(md_text), repeats)
+        stages["vector_store"] = _summarize(timings)
+        for name in ("chunk", "embed", "index_build"):
+            stages[name] = _summarize(span_timings[name])
+        meta["chunks"] = vectorstore.index.ntotal
+
+        timings, _ = _time(lambda: [vectorstore.similarity_search(q, k=4) for q in QUERIES], repeats)
+        stages["retrieval"] = _summarize(timings)
+        stages["retrieval"]["queries_per_run"] = len(QUERIES)
+
+        stages["context_pack"] = _summarize(_time(
+            lambda: context_packer.pack_markdown(md_text, context_packer.PRESENTATION_TOKEN_BUDGET, query="retrieval accuracy"), repeats)[0])
+        stages["chart_extract_local"] = _summarize(_time(lambda: viz_tools.extract_chart_data_locally(md_text), repeats)[0])
+
+        timings, presentation = _time(
+            lambda: research_tools.generate_presentation(md_text, llm, topic="retrieval"), repeats)
+        stages["presentation_llm"] = _summarize(timings)
+        presentation, chart_data = viz_tools.resolve_chart_data(presentation, llm)
+
+        timings, articles = _time(lambda: market_tools.search_market("ai research tools"), repeats)
+        stages["market_search"] = _summarize(timings)
+        timings, market_report = _time(lambda: market_tools.generate_market_report("ai research tools", articles, llm), repeats)
+        stages["market_report"] = _summarize(timings)
+
+        export_images = image_tools.collect_report_images(image_dir)
+        def reset_exports():
+            shutil.rmtree(report_generator.EXPORT_CACHE_DIR, ignore_errors=True)
+        timings, pdf_out = _time(lambda: report_generator.generate_pdf(presentation, "bench_report.pdf", images=export_images), repeats, setup=reset_exports)
+        stages["export_pdf"] = _summarize(timings)
+        meta["export_pdf_bytes"] = os.path.getsize(pdf_out)
+        timings, docx_out = _time(lambda: report_generator.generate_docx(presentation, "bench_report.docx", images=export_images), repeats, setup=reset_exports)
+        stages["export_docx"] = _summarize(timings)
+        meta["export_docx_bytes"] = os.path.getsize(docx_out)
+        stages["export_cached"] = _summarize(_time(
+            lambda: (report_generator.generate_pdf(presentation, "bench_report.pdf", images=export_images),
+                     report_generator.generate_docx(presentation, "bench_report.docx", images=export_images)), repeats)[0])
+
+        def db_writes():
+            db_client.save_report("retrieval", "Academic", presentation, "bench-user")
+            for _ in range(10):
+                db_client.log_usage("bench-user", "llama-3.3-70b", 1000, 200)
+            return db_client.get_history("bench-user")
+        timings, history = _time(db_writes, repeats)
+        stages["db_writes"] = _summarize(timings)
+        meta["db_rows"] = {table: len(rows) for table, rows in supabase.store.items()}
+
+    meta["llm_calls"] = llm.calls
+    meta["llm_latency_s"] = llm_latency
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": repeats,
+        "stages": stages,
+        "meta": meta,
+    }
+
+def compare(current: dict, baseline: dict, threshold: float = 0.10, min_delta_ms: float = 1.0):
+    """
+    Prints the median change per stage; returns the stages slower than baseline by more than
+    threshold (ignoring sub-millisecond jitter on very fast stages).
+    """
+    regressions = []
+    if current["meta"].get("embeddings") != baseline.get("meta", {}).get("embeddings"):
+        print(f"⚠️ Embeddings differ (baseline: {baseline.get('meta', {}).get('embeddings')}, "
+              f"current: {current['meta'].get('embeddings')}); embed/retrieval are not comparable.")
+    print(f"{'stage':<22}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name, stage in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            print(f"{name:<22}{'-':>14}{stage['median_ms']:>14.2f}{'new':>10}")
+            continue
+        change = (stage["median_ms"] - base["median_ms"]) / base["median_ms"] if base["median_ms"] else 0.0
+        regressed = change > threshold and stage["median_ms"] - base["median_ms"] > min_delta_ms
+        flag = " ⚠️" if regressed else ""
+        print(f"{name:<22}{base['median_ms']:>14.2f}{stage['median_ms']:>14.2f}{change:>+9.0%}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per fake LLM call")
+    parser.add_argument("--embeddings", choices=["auto", "real", "fake"], default="auto",
+                        help="Embedding model for embed/retrieval: real all-MiniLM-L6-v2 (downloaded once), "
+                             "hash-based fake, or real when already cached (default)")
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeats, args.llm_latency, args.embeddings)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+    else:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import os
+import re
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken missing or its encoding file not downloadable: fall back to ~4 characters per token
+    _ENCODING = None
+
+# Prompt budgets (in tokens), overridable from the environment
+PRESENTATION_TOKEN_BUDGET = int(os.getenv("PRESENTATION_TOKEN_BUDGET", "2000"))
+MARKET_TOKEN_BUDGET = int(os.getenv("MARKET_TOKEN_BUDGET", "2000"))
+CHART_TOKEN_BUDGET = int(os.getenv("CHART_TOKEN_BUDGET", "800"))
+
+# Relative value of a paper section, matched against its heading. Zero means never include.
+SECTION_WEIGHTS = [
+    ("abstract", 3.0),
+    ("result", 2.5),
+    ("experiment", 2.5),
+    ("evaluation", 2.5),
+    ("conclusion", 2.0),
+    ("discussion", 2.0),
+    ("summary", 2.0),
+    ("introduction", 1.5),
+    ("method", 1.5),
+    ("approach", 1.5),
+    ("related work", 0.5),
+    ("background", 0.75),
+    ("reference", 0.0),
+    ("bibliography", 0.0),
+    ("acknowledg", 0.0),
+    ("appendix", 0.3),
+]
+DEFAULT_SECTION_WEIGHT = 1.0
+
+_HEADING_RE = re.compile(r"^(#{1,6}\s+.+|\*\*\s*\d+(\.\d+)*\.?\s+[^*]+\*\*)$")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_NUMBER_RE = re.compile(r"\d+(\.\d+)?\s*%?")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{2,}")
+_STOPWORDS = {"the", "a", "an", "of", "and", "or", "in", "on", "for", "to", "with", "is", "are", "by", "at", "from"}
+
+def count_tokens(text: str) -> int:
+    """
+    Counts prompt tokens (cl100k_base when tiktoken is available, otherwise an estimate).
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts text down to at most max_tokens tokens.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _ENCODING is not None:
+        return _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:max(0, max_tokens)])
+    return text[:max(0, max_tokens) * 4]
+
+def _split_oversized(text: str, max_tokens: int) -> list:
+    """
+    Splits a paragraph larger than max_tokens into pieces at line boundaries, then at
+    sentence boundaries; a single sentence that is still too large is truncated.
+    Pieces of a markdown table repeat its header rows so each one stays a valid table.
+    """
+    lines = text.splitlines()
+    prefix = ""
+    if len(lines) > 2 and lines[0].lstrip().startswith("|") and _TABLE_SEPARATOR_RE.match(lines[1].strip()):
+        if count_tokens("\n".join(lines[:2])) <= max_tokens // 2:
+            prefix = "\n".join(lines[:2]) + "\n"
+            lines = lines[2:]
+
+    # (text, separator placed before it when it continues a piece)
+    parts = []
+    for line in lines:
+        if count_tokens(line) <= max_tokens:
+            parts.append((line, "\n"))
+            continue
+        for n, sentence in enumerate(_SENTENCE_RE.split(line)):
+            parts.append((truncate_to_tokens(sentence, max_tokens - count_tokens(prefix)), " " if n else "\n"))
+
+    pieces = []
+    current = ""
+    for part, separator in parts:
+        candidate = f"{current}{separator}{part}" if current else part
+        if current and count_tokens(prefix + candidate) > max_tokens:
+            pieces.append(prefix + current)
+            candidate = part
+        current = candidate
+    if current:
+        pieces.append(prefix + current)
+    return pieces
+
+def _split_units(units: list, budget_tokens: int) -> list:
+    """
+    Replaces units too large to share the budget (one long Results block, a big table,
+    a whole article without paragraph breaks) with smaller pieces of the same unit.
+    """
+    max_tokens = max(1, budget_tokens // 2)
+    split = []
+    for unit in units:
+        if unit["tokens"] <= max_tokens:
+            split.append(unit)
+            continue
+        for piece in _split_oversized(unit["text"], max_tokens):
+            split.append({**unit, "text": piece, "tokens": count_tokens(piece)})
+    return split
+
+def _section_weight(heading: str) -> float:
+    heading = heading.lower()
+    for key, weight in SECTION_WEIGHTS:
+        if key in heading:
+            return weight
+    return DEFAULT_SECTION_WEIGHT
+
+def _split_sections(md_text: str) -> list:
+    """
+    Splits markdown into (heading, [paragraphs]) pairs. Text before the first heading
+    gets an empty heading.
+    """
+    sections = [("", [])]
+    paragraph = []
+    for line in md_text.splitlines():
+        stripped = line.strip()
+        if _HEADING_RE.match(stripped):
+            if paragraph:
+                sections[-1][1].append("\n".join(paragraph))
+                paragraph = []
+            sections.append((stripped, []))
+        elif not stripped:
+            if paragraph:
+                sections[-1][1].append("\n".join(paragraph))
+                paragraph = []
+        else:
+            paragraph.append(line)
+    if paragraph:
+        sections[-1][1].append("\n".join(paragraph))
+    return [(heading, paras) for heading, paras in sections if paras]
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _relevance(paragraphs: list, query: str, embeddings=None) -> list:
+    """
+    Similarity of each paragraph to the query in [0, 1]: cosine similarity when an
+    embeddings model is given, otherwise the share of query terms the paragraph contains.
+    """
+    if not query:
+        return [0.0] * len(paragraphs)
+
+    if embeddings is not None:
+        query_vec = embeddings.embed_query(query)
+        para_vecs = embeddings.embed_documents(paragraphs)
+        query_norm = sum(q * q for q in query_vec) ** 0.5 or 1.0
+        scores = []
+        for vec in para_vecs:
+            norm = sum(v * v for v in vec) ** 0.5 or 1.0
+            scores.append(max(0.0, sum(q * v for q, v in zip(query_vec, vec)) / (query_norm * norm)))
+        return scores
+
+    terms = {w for w in _WORD_RE.findall(query.lower()) if w not in _STOPWORDS}
+    if not terms:
+        return [0.0] * len(paragraphs)
+    return [len(terms & set(_WORD_RE.findall(p.lower()))) / len(terms) for p in paragraphs]
+
+def _select(units: list, budget_tokens: int, query: str = None, embeddings=None, group_tokens: dict = None) -> set:
+    """
+    Greedy knapsack over scored units (dicts with 'text' and 'weight').
+    Returns the indices of the units to keep, skipping near-duplicates of kept text.
+    Units may name a 'group' (section heading, article header) whose cost in group_tokens
+    is charged once, when the first unit of that group is kept.
+    """
+    group_tokens = group_tokens or {}
+    relevance = _relevance([u["text"] for u in units], query, embeddings)
+    ranked = []
+    for i, unit in enumerate(units):
+        text = unit["text"].strip()
+        # Short lines are noise (captions, bylines) unless they carry a figure ("Revenue up 5%.")
+        if unit["weight"] <= 0 or not text or (len(text) < 30 and not _NUMBER_RE.search(text)):
+            continue
+        # Paragraphs with figures are usually the findings worth keeping
+        numeric_bonus = min(len(_NUMBER_RE.findall(unit["text"])), 5) * 0.05
+        ranked.append((unit["weight"] * (1.0 + relevance[i] + numeric_bonus), i))
+    ranked.sort(key=lambda item: -item[0])
+
+    selected = set()
+    seen_shingles = set()
+    charged_groups = set()
+    remaining = budget_tokens
+    for _, i in ranked:
+        group = units[i].get("group")
+        cost = units[i]["tokens"] + (group_tokens.get(group, 0) if group not in charged_groups else 0)
+        if cost > remaining:
+            continue
+        shingles = _shingles(units[i]["text"])
+        if shingles and len(shingles & seen_shingles) / len(shingles) >= 0.6:
+            continue
+        selected.add(i)
+        charged_groups.add(group)
+        seen_shingles |= shingles
+        remaining -= cost
+        if remaining <= 0:
+            break
+
+    if not selected:
+        # Never pack non-empty input into nothing: keep the best unit, cut to the budget
+        candidates = [i for _, i in ranked] or [i for i, unit in enumerate(units) if unit["text"].strip()]
+        if candidates:
+            best = candidates[0]
+            room = budget_tokens - group_tokens.get(units[best].get("group"), 0)
+            units[best]["text"] = truncate_to_tokens(units[best]["text"], max(1, room))
+            units[best]["tokens"] = count_tokens(units[best]["text"])
+            selected.add(best)
+    return selected
+
+def pack_markdown(md_text: str, budget_tokens: int, query: str = None, embeddings=None) -> str:
+    """
+    Fills a token budget with the most valuable paragraphs of a markdown document.
+    Paragraphs are ranked by section type (Abstract/Results first, References never)
+    and similarity to the query; kept paragraphs are returned in document order
+    under their section headings.
+    """
+    if count_tokens(md_text) <= budget_tokens:
+        return md_text
+
+    units = []
+    for heading, paragraphs in _split_sections(md_text):
+        weight = _section_weight(heading)
+        for paragraph in paragraphs:
+            units.append({"heading": heading, "group": heading, "text": paragraph, "weight": weight, "tokens": count_tokens(paragraph)})
+
+    # A heading is re-emitted (and paid for) only above paragraphs that are kept
+    heading_tokens = {u["heading"]: count_tokens(u["heading"]) for u in units}
+    units = _split_units(units, budget_tokens)
+    selected = _select(units, budget_tokens, query, embeddings, heading_tokens)
+
+    lines = []
+    current_heading = None
+    for i, unit in enumerate(units):
+        if i not in selected:
+            continue
+        if unit["heading"] != current_heading:
+            current_heading = unit["heading"]
+            if current_heading:
+                lines.append(current_heading)
+        lines.append(unit["text"])
+    packed = "\n\n".join(lines)
+    print(f"📦 Packed {count_tokens(packed)}/{budget_tokens} tokens ({len(selected)}/{len(units)} paragraphs).")
+    return packed
+
+def pack_articles(articles: list, budget_tokens: int, query: str = None, embeddings=None) -> str:
+    """
+    Builds the market report context from several articles within a token budget.
+    Each article is a dict with 'title', 'source' and 'text'. Lead paragraphs rank higher,
+    text repeated across articles (syndicated stories, boilerplate) is kept only once,
+    and articles with nothing selected are left out.
+    """
+    units = []
+    for a, article in enumerate(articles):
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", article["text"]) if p.strip()]
+        for position, paragraph in enumerate(paragraphs):
+            units.append({
+                "article": a,
+                "group": a,
+                "text": paragraph,
+                "weight": 1.0 / (1.0 + 0.1 * position),
+                "tokens": count_tokens(paragraph),
+            })
+
+    # An article's header is paid for only when some of its text is kept
+    header_tokens = {a: count_tokens(f"--- Article {a + 1}: {art['title']} ---\nSource: {art['source']}\nContent: ")
+                     for a, art in enumerate(articles)}
+    if sum(u["tokens"] for u in units) + sum(header_tokens.values()) <= budget_tokens:
+        # Everything fits: keep every paragraph, short ones included
+        selected = set(range(len(units)))
+    else:
+        units = _split_units(units, budget_tokens)
+        selected = _select(units, budget_tokens, query, embeddings, header_tokens)
+
+    context = ""
+    for a, article in enumerate(articles):
+        kept = [u["text"] for i, u in enumerate(units) if u["article"] == a and i in selected]
+        if not kept:
+            continue
+        context += f"\n--- Article {a + 1}: {article['title']} ---\n"
+        context += f"Source: {article['source']}\n"
+        context += "Content: " + "\n\n".join(kept) + "\n"
+    print(f"📦 Packed {count_tokens(context)}/{budget_tokens} tokens from {len(articles)} articles ({len(selected)}/{len(units)} paragraphs).")
+    return context
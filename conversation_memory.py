@@ -0,0 +1,91 @@
+from langchain_core.messages import HumanMessage, AIMessage
+from context_packer import count_tokens
+
+class ConversationMemory:
+    """
+    Bounded chat memory for the Analyst Chat: the last `window_turns` exchanges are kept
+    verbatim (capped at `max_history_tokens`), older ones are folded into a running summary
+    that is updated incrementally, one batch of evicted messages at a time.
+    """
+
+    def __init__(self, window_turns: int = 3, max_history_tokens: int = 1200, summary_words: int = 150):
+        self.window_turns = window_turns
+        self.max_history_tokens = max_history_tokens
+        self.summary_words = summary_words
+        self.messages = []
+        self.summary = ""
+        self.summarized_upto = 0
+        self.turn_stats = []
+
+    def add(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+
+    def _window_start(self) -> int:
+        return max(self.summarized_upto, len(self.messages) - 2 * self.window_turns)
+
+    def history_messages(self) -> list:
+        """
+        Recent messages as LangChain messages, dropping the oldest until they fit max_history_tokens.
+        """
+        recent = self.messages[self._window_start():]
+        while recent and sum(count_tokens(m["content"]) for m in recent) > self.max_history_tokens:
+            recent = recent[1:]
+        return [HumanMessage(content=m["content"]) if m["role"] == "user" else AIMessage(content=m["content"]) for m in recent]
+
+    def update_summary(self, llm):
+        """
+        Folds messages that fell out of the window into the summary (one LLM call, only when needed).
+        """
+        cutoff = len(self.messages) - 2 * self.window_turns
+        if cutoff <= self.summarized_upto:
+            return
+        evicted = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in self.messages[self.summarized_upto:cutoff])
+        prompt = (
+            "Update the running summary of an analyst conversation with the new exchanges below. "
+            f"Keep facts, numbers and open questions; at most {self.summary_words} words. Return only the summary.\n\n"
+            f"Current summary:\n{self.summary or '(empty)'}\n\n"
+            f"New exchanges:\n{evicted}"
+        )
+        try:
+            self.summary = llm.invoke([HumanMessage(content=prompt)]).content.strip()
+            self.summarized_upto = cutoff
+        except Exception as e:
+            # Keep the old summary; the evicted messages are retried on the next turn
+            print(f"⚠️ Error updating conversation summary: {e}")
+
+    def condense_question(self, question: str, llm) -> str:
+        """
+        Rewrites a follow-up ("what about its accuracy?") into a standalone retrieval query.
+        The first question of a chat is returned unchanged without an LLM call.
+        """
+        if not self.messages:
+            return question
+        recent = "\n".join(f"{m['role'].upper()}: {m['content'][:500]}" for m in self.messages[-2:])
+        prompt = (
+            "Rewrite the follow-up question as a standalone question that can be understood without the conversation. "
+            "Resolve pronouns and references. Return ONLY the question.\n\n"
+            f"Conversation summary: {self.summary or '(none)'}\n"
+            f"Recent messages:\n{recent}\n\n"
+            f"Follow-up question: {question}"
+        )
+        try:
+            standalone = llm.invoke([HumanMessage(content=prompt)]).content.strip()
+            return standalone or question
+        except Exception as e:
+            print(f"⚠️ Error condensing question: {e}")
+            return question
+
+    def record_turn(self, question: str, context_docs: list) -> dict:
+        """
+        Records the prompt size of one chat turn, broken down by component.
+        """
+        stats = {
+            "turn": len(self.turn_stats) + 1,
+            "question_tokens": count_tokens(question),
+            "history_tokens": sum(count_tokens(m.content) for m in self.history_messages()),
+            "summary_tokens": count_tokens(self.summary),
+            "context_tokens": sum(count_tokens(getattr(d, "page_content", str(d))) for d in context_docs),
+        }
+        stats["total_tokens"] = sum(v for k, v in stats.items() if k.endswith("_tokens"))
+        self.turn_stats.append(stats)
+        return stats
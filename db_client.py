@@ -1,6 +1,7 @@
 import os
 from supabase import create_client, Client
 from datetime import datetime
+from tracing import span
 
 def get_supabase_client(access_token: str = None):
     url = os.environ.get("SUPABASE_URL")
@@ -33,11 +34,12 @@ def sign_in(email, password):
 def save_report(topic: str, report_type: str, content: str, user_id: str = None, access_token: str = None):
     """
     Saves the generated report to Supabase.
+    Returns True when the row was written (RLS requires user_id and that user's access_token).
     """
     supabase = get_supabase_client(access_token)
     if not supabase:
         print("⚠️ Supabase credentials not found. Report not saved.")
-        return
+        return False
 
     data = {
         "topic": topic,
@@ -49,10 +51,13 @@ def save_report(topic: str, report_type: str, content: str, user_id: str = None,
         data["user_id"] = user_id
     
     try:
-        supabase.table("research_reports").insert(data).execute()
+        with span("db_write", table="research_reports", chars=len(content)):
+            supabase.table("research_reports").insert(data).execute()
         print("✅ Report saved to Supabase!")
+        return True
     except Exception as e:
         print(f"❌ Error saving to Supabase: {e}")
+        return False
 
 def get_user_role(user_id: str, access_token: str = None):
     """
@@ -83,7 +88,8 @@ def get_history(user_id: str = None, role: str = "user", access_token: str = Non
         if role != 'admin' and user_id:
             query = query.eq("user_id", user_id)
         
-        response = query.execute()
+        with span("db_read", table="research_reports"):
+            response = query.execute()
         return response.data
     except Exception as e:
         print(f"❌ Error fetching history: {e}")
@@ -97,12 +103,13 @@ def log_usage(user_id: str, model: str, input_tokens: int, output_tokens: int, a
     if not supabase: return
 
     try:
-        supabase.table("usage_logs").insert({
-            "user_id": user_id,
-            "model": model,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens
-        }).execute()
+        with span("db_write", table="usage_logs"):
+            supabase.table("usage_logs").insert({
+                "user_id": user_id,
+                "model": model,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens
+            }).execute()
         print(f"📊 Usage logged: {input_tokens} in / {output_tokens} out")
     except Exception as e:
         print(f"❌ Error logging usage: {e}")
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import hashlib
+from PIL import Image, features
+from tracing import traced, set_attribute
+
+# Widths (in pixels) of the cached downscaled copies kept for every extracted figure.
+PYRAMID_WIDTHS = (256, 768, 1280)
+THUMB_DIR_NAME = "thumbs"
+MANIFEST_NAME = "manifest.json"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+# Gallery previews are small WebP files (PNG when Pillow lacks WebP support).
+PREVIEW_WIDTH = 320
+PREVIEW_FORMAT = "WEBP" if features.check("webp") else "PNG"
+
+def _average_hash(img: Image.Image) -> str:
+    """
+    Computes a 64-bit perceptual (average) hash, used to spot re-encoded duplicates.
+    """
+    small = img.convert("L").resize((8, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    mean = sum(pixels) / len(pixels)
+    bits = "".join("1" if p >= mean else "0" for p in pixels)
+    return f"{int(bits, 2):016x}"
+
+def _natural_key(name: str):
+    # pymupdf4llm names figures "<file>-<page>-<index>.png"; sort page 10 after page 9
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+def _load_manifest(thumb_dir: str) -> dict:
+    manifest_path = os.path.join(thumb_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+def _save_manifest(thumb_dir: str, manifest: dict):
+    with open(os.path.join(thumb_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    """
+    Flattens transparency onto white; the PDF/DOCX writers cannot handle alpha channels.
+    """
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img.convert("RGB")
+
+def build_thumbnail_pyramid(image_path: str, thumb_dir: str, manifest: dict, widths=PYRAMID_WIDTHS) -> dict:
+    """
+    Creates (or reuses) downscaled JPEG copies of one image.
+    Returns the manifest entry: digest, perceptual hash, size and the path of each pyramid level.
+    """
+    name = os.path.basename(image_path)
+    stat = os.stat(image_path)
+    entry = manifest.get(name)
+    if (entry and entry["mtime"] == stat.st_mtime and entry["bytes"] == stat.st_size
+            and all(os.path.exists(p) for p in entry["levels"].values())):
+        return entry
+
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+
+    with Image.open(image_path) as img:
+        img = _to_rgb(img)
+        width, height = img.size
+        stem = os.path.splitext(name)[0]
+        levels = {}
+        for w in widths:
+            level_path = os.path.join(thumb_dir, f"{stem}_{w}.jpg")
+            if width <= w:
+                # Never upscale: the smallest level that covers the original is the original size
+                level_img = img
+            else:
+                level_img = img.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+            level_img.save(level_path, "JPEG", quality=80, optimize=True)
+            levels[str(w)] = level_path
+            if width <= w:
+                break
+
+        entry = {
+            "mtime": stat.st_mtime,
+            "bytes": stat.st_size,
+            "digest": digest,
+            "ahash": _average_hash(img),
+            "width": width,
+            "height": height,
+            "levels": levels,
+        }
+    manifest[name] = entry
+    return entry
+
+def _pick_level(entry: dict, max_width: int) -> str:
+    """
+    Returns the largest cached level that does not exceed max_width (or the smallest one).
+    """
+    levels = sorted(entry["levels"].items(), key=lambda kv: int(kv[0]))
+    chosen = levels[0][1]
+    for w, path in levels:
+        if int(w) <= max_width:
+            chosen = path
+    return chosen
+
+def build_preview(image_path: str, thumb_dir: str, entry: dict, width: int = PREVIEW_WIDTH) -> str:
+    """
+    Creates (or reuses) the small gallery preview of one image and records it in its manifest entry.
+    """
+    preview = entry.get("preview")
+    if preview and preview["width"] == width and os.path.exists(preview["path"]):
+        return preview["path"]
+
+    ext = ".webp" if PREVIEW_FORMAT == "WEBP" else ".png"
+    preview_path = os.path.join(thumb_dir, f"{os.path.splitext(os.path.basename(image_path))[0]}_preview{ext}")
+    with Image.open(image_path) as img:
+        img = img.convert("RGBA") if img.mode in ("RGBA", "LA", "P") else img.convert("RGB")
+        img.thumbnail((width, width * 4), Image.LANCZOS)
+        if PREVIEW_FORMAT == "WEBP":
+            img.save(preview_path, PREVIEW_FORMAT, quality=75, method=4)
+        else:
+            img.save(preview_path, PREVIEW_FORMAT, optimize=True)
+
+    entry["preview"] = {"path": preview_path, "width": width, "bytes": os.path.getsize(preview_path)}
+    return preview_path
+
+@traced("thumbnails")
+def _scan_images(image_dir: str, min_side: int, with_preview: bool = False) -> list:
+    """
+    Runs the (cached) thumbnail stage over a directory of extracted figures.
+    Returns (name, manifest entry) pairs in page order, without tiny decorations or duplicates.
+    """
+    if not image_dir or not os.path.isdir(image_dir):
+        return []
+
+    thumb_dir = os.path.join(image_dir, THUMB_DIR_NAME)
+    os.makedirs(thumb_dir, exist_ok=True)
+    manifest = _load_manifest(thumb_dir)
+
+    unique = []
+    seen = set()
+    for name in sorted(os.listdir(image_dir), key=_natural_key):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image_path = os.path.join(image_dir, name)
+        try:
+            entry = build_thumbnail_pyramid(image_path, thumb_dir, manifest)
+            if with_preview:
+                build_preview(image_path, thumb_dir, entry)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping image {name}: {e}")
+            continue
+
+        if min(entry["width"], entry["height"]) < min_side:
+            continue
+        if entry["digest"] in seen or entry["ahash"] in seen:
+            continue
+        seen.update((entry["digest"], entry["ahash"]))
+        unique.append((name, entry))
+
+    _save_manifest(thumb_dir, manifest)
+    set_attribute("images", len(unique))
+    return unique
+
+def collect_report_images(image_dir: str, max_width: int = 768, min_side: int = 100, max_images: int = 24) -> list:
+    """
+    Prepares the figures of a parsed paper for export.
+    Skips tiny decorations, drops exact and near-duplicate figures, and returns
+    paths to cached downscaled copies (at most max_width pixels wide).
+    """
+    entries = _scan_images(image_dir, min_side)[:max_images]
+    return [_pick_level(entry, max_width) for _, entry in entries]
+
+def prepare_gallery(image_dir: str, min_side: int = 100) -> list:
+    """
+    Thumbnail stage run right after parsing a paper.
+    Returns one dict per unique figure with the original path, the preview path and both file sizes.
+    """
+    gallery = []
+    for name, entry in _scan_images(image_dir, min_side, with_preview=True):
+        gallery.append({
+            "name": name,
+            "original": os.path.join(image_dir, name),
+            "preview": entry["preview"]["path"],
+            "original_bytes": entry["bytes"],
+            "preview_bytes": entry["preview"]["bytes"],
+        })
+    return gallery
@@ -0,0 +1,253 @@
+import os
+import time
+import heapq
+import random
+import itertools
+import threading
+from context_packer import count_tokens
+from tracing import span, set_attribute
+
+# Lower value = served first. Analyst Chat jumps ahead of report generation and batch runs.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Rough completion size assumed when reserving tokens before a call; corrected afterwards
+COMPLETION_TOKEN_ESTIMATE = 600
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    True for HTTP 429 / rate-limit errors raised by the Groq client (or any wrapper around it).
+    """
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "rate_limit" in message
+
+def _retry_after(error: Exception):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _usage_tokens(result):
+    metadata = getattr(result, "response_metadata", None) or {}
+    usage = metadata.get('token_usage', {})
+    if not usage:
+        return None
+    return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)
+
+def estimate_tokens(llm_input) -> int:
+    """
+    Estimates the tokens a call will consume: the prompt plus COMPLETION_TOKEN_ESTIMATE.
+    Accepts a string, a list of messages or a dict of chain inputs.
+    """
+    if isinstance(llm_input, str):
+        text = llm_input
+    elif isinstance(llm_input, dict):
+        text = " ".join(str(v) for v in llm_input.values())
+    else:
+        text = " ".join(str(getattr(m, "content", m)) for m in llm_input)
+    return count_tokens(text) + COMPLETION_TOKEN_ESTIMATE
+
+class RateLimitGovernor:
+    """
+    Process-wide limiter for LLM calls: token buckets for requests/min and tokens/min,
+    a cap on calls in flight, a priority queue in front of both, and jittered
+    exponential backoff when the provider still answers 429.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int = 4,
+                 max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._sleep = sleep
+
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._request_bucket = float(requests_per_minute)
+        self._token_bucket = float(tokens_per_minute)
+        self._last_refill = clock()
+        self._in_flight = 0
+        self._metrics = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "max_queue_depth": 0,
+            "wait_by_priority": {},
+        }
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_bucket = min(self.requests_per_minute, self._request_bucket + elapsed * self.requests_per_minute / 60.0)
+        self._token_bucket = min(self.tokens_per_minute, self._token_bucket + elapsed * self.tokens_per_minute / 60.0)
+
+    def acquire(self, estimated_tokens: int, priority: int = PRIORITY_BATCH) -> float:
+        """
+        Blocks until this call is at the head of the queue and both buckets have room.
+        Returns the seconds spent waiting.
+        """
+        # A single call larger than the whole bucket would wait forever; let it drain the bucket instead
+        needed_tokens = min(estimated_tokens, self.tokens_per_minute)
+        start = self._clock()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], len(self._queue))
+            while True:
+                self._refill()
+                if (self._queue[0] == ticket and self._in_flight < self.max_concurrency
+                        and self._request_bucket >= 1 and self._token_bucket >= needed_tokens):
+                    heapq.heappop(self._queue)
+                    self._request_bucket -= 1
+                    self._token_bucket -= needed_tokens
+                    self._in_flight += 1
+                    self._cond.notify_all()
+                    break
+
+                if self._queue[0] == ticket and self._in_flight < self.max_concurrency:
+                    # Only the buckets are short: wait for the refill on the (injectable) clock
+                    timeout = 1.0
+                    if self._request_bucket < 1:
+                        timeout = min(timeout, (1 - self._request_bucket) * 60.0 / self.requests_per_minute)
+                    if self._token_bucket < needed_tokens:
+                        timeout = min(timeout, (needed_tokens - self._token_bucket) * 60.0 / self.tokens_per_minute)
+                    self._cond.release()
+                    try:
+                        self._sleep(max(timeout, 0.01))
+                    finally:
+                        self._cond.acquire()
+                else:
+                    # Behind another call or at the concurrency cap: woken by the pop/release that frees us
+                    self._cond.wait(1.0)
+
+            waited = self._clock() - start
+            self._metrics["total_wait_seconds"] += waited
+            self._metrics["max_wait_seconds"] = max(self._metrics["max_wait_seconds"], waited)
+            by_priority = self._metrics["wait_by_priority"].setdefault(priority, {"calls": 0, "wait_seconds": 0.0})
+            by_priority["calls"] += 1
+            by_priority["wait_seconds"] += waited
+        return waited
+
+    def release(self, reserved_tokens: int, usage=None):
+        """
+        Frees the concurrency slot and settles the token reservation against the real usage.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if usage:
+                prompt_tokens, completion_tokens = usage
+                self._metrics["prompt_tokens"] += prompt_tokens
+                self._metrics["completion_tokens"] += completion_tokens
+                # Refund an over-estimate, or go into debt for an under-estimate
+                self._token_bucket += min(reserved_tokens, self.tokens_per_minute) - (prompt_tokens + completion_tokens)
+            self._cond.notify_all()
+
+    def call(self, fn, *args, priority: int = PRIORITY_BATCH, estimated_tokens: int = COMPLETION_TOKEN_ESTIMATE, **kwargs):
+        """
+        Runs fn(*args, **kwargs) under the limiter, retrying 429s with full-jitter backoff
+        (or the server's Retry-After when given).
+        """
+        attempt = 0
+        while True:
+            waited = self.acquire(estimated_tokens, priority)
+            set_attribute("queue_wait_s", round(waited, 3))
+            set_attribute("attempts", attempt + 1)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.release(estimated_tokens)
+                if is_rate_limit_error(e):
+                    with self._cond:
+                        self._metrics["rate_limited"] += 1
+                        # The provider disagrees with our buckets: empty them so queued calls back off too
+                        self._token_bucket = min(self._token_bucket, 0.0)
+                    if attempt < self.max_retries:
+                        delay = _retry_after(e) or random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                        print(f"⏳ Rate limited, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})...")
+                        with self._cond:
+                            self._metrics["retries"] += 1
+                        self._sleep(delay)
+                        attempt += 1
+                        continue
+                with self._cond:
+                    self._metrics["failures"] += 1
+                raise
+            usage = _usage_tokens(result)
+            if usage:
+                set_attribute("prompt_tokens", usage[0])
+                set_attribute("completion_tokens", usage[1])
+            self.release(estimated_tokens, usage)
+            with self._cond:
+                self._metrics["calls"] += 1
+            return result
+
+    def snapshot(self) -> dict:
+        """
+        Current queue depth, calls in flight, bucket levels and cumulative metrics.
+        """
+        with self._cond:
+            self._refill()
+            metrics = dict(self._metrics)
+            metrics["wait_by_priority"] = {k: dict(v) for k, v in self._metrics["wait_by_priority"].items()}
+            metrics.update({
+                "queue_depth": len(self._queue),
+                "in_flight": self._in_flight,
+                "request_bucket": round(self._request_bucket, 2),
+                "token_bucket": round(self._token_bucket, 1),
+            })
+            served = sum(v["calls"] for v in metrics["wait_by_priority"].values())
+            metrics["avg_wait_seconds"] = metrics["total_wait_seconds"] / served if served else 0.0
+        return metrics
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_governor() -> RateLimitGovernor:
+    """
+    Returns the process-wide governor shared by all Streamlit sessions (limits from the environment).
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = RateLimitGovernor(
+                requests_per_minute=int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")),
+                tokens_per_minute=int(os.getenv("GROQ_TOKENS_PER_MINUTE", "12000")),
+                max_concurrency=int(os.getenv("GROQ_MAX_CONCURRENCY", "4")),
+                max_retries=int(os.getenv("GROQ_MAX_RETRIES", "4")),
+            )
+        return _governor
+
+class GovernedLLM:
+    """
+    Drop-in wrapper for a chat model: invoke() goes through the governor at a fixed priority,
+    everything else is delegated to the wrapped model (available as .llm).
+    """
+
+    def __init__(self, llm, governor: RateLimitGovernor = None, priority: int = PRIORITY_BATCH):
+        self.llm = llm
+        self.governor = governor or get_governor()
+        self.priority = priority
+
+    def invoke(self, llm_input, *args, **kwargs):
+        with span("llm", priority=self.priority):
+            return self.governor.call(self.llm.invoke, llm_input, *args, priority=self.priority,
+                                      estimated_tokens=estimate_tokens(llm_input), **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
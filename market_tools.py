@@ -4,7 +4,13 @@ import newspaper
 from langchain_core.messages import HumanMessage
 import time
 from db_client import log_usage
+from viz_tools import CHART_SECTION_INSTRUCTIONS
+from context_packer import pack_articles, MARKET_TOKEN_BUDGET
+from rag_engine import split_markdown
+from summarizer import group_chunks, map_reduce as run_map_reduce, total_usage
+from tracing import traced, set_attribute
 
+@traced("market_search")
 def search_market(topic: str, max_results: int = 5):
     """
     Searches DuckDuckGo for market news related to the topic.
@@ -42,12 +48,15 @@ def search_market(topic: str, max_results: int = 5):
         except Exception as e2:
              print(f"❌ Market search completely failed: {e2}")
              
+    set_attribute("results", len(results))
     return results
 
+@traced("article_fetch")
 def get_article_content(url: str):
     """
     Downloads and parses the article content using newspaper3k.
     """
+    set_attribute("url", url)
     try:
         article = newspaper.Article(url)
         article.download()
@@ -62,25 +71,8 @@ def get_article_content(url: str):
         print(f"⚠️ Error fetching {url}: {e}")
         return None
 
-def generate_market_report(topic: str, articles: list, llm, user_id: str = None):
-    """
-    Generates a strategic market report based on the fetched articles.
-    """
-    print("📊 Generating Market Report...")
-    
-    # Prepare context
-    context = ""
-    for i, art in enumerate(articles):
-        content = get_article_content(art['url'])
-        if content:
-            context += f"\n--- Article {i+1}: {art['title']} ---\n"
-            context += f"Source: {art['source']}\n"
-            context += f"Content: {content['text'][:2000]}...\n" # Truncate to avoid token limits
-    
-    if not context:
-        return "No valid articles found to generate a report."
-
-    prompt = (
+def _market_report_prompt(topic: str, context: str) -> str:
+    return (
         f"You are a Senior Market Analyst. Analyze the following news articles about '{topic}'.\n\n"
         f"{context}\n\n"
         "Create a comprehensive Market Intelligence Report with the following sections:\n"
@@ -89,10 +81,52 @@ def generate_market_report(topic: str, articles: list, llm, user_id: str = None)
         "3. **Competitor Landscape**: Who are the key players mentioned?\n"
         "4. **SWOT Analysis**: Create a table of Strengths, Weaknesses, Opportunities, and Threats.\n"
         "5. **Strategic Outlook**: What should be the next steps?\n\n"
-        "Format the output in clean Markdown."
+        "Format the output in clean Markdown.\n\n"
+        f"{CHART_SECTION_INSTRUCTIONS}"
     )
+
+@traced("market_report")
+def generate_market_report(topic: str, articles: list, llm, user_id: str = None, map_reduce: bool = False):
+    """
+    Generates a strategic market report based on the fetched articles.
+    With map_reduce, every article is summarized in full (in parallel) before the report is written,
+    instead of packing excerpts into MARKET_TOKEN_BUDGET.
+    The reply ends with a chart-data block; split it off with viz_tools.resolve_chart_data.
+    """
+    set_attribute("articles", len(articles))
+    set_attribute("map_reduce", map_reduce)
+    print("📊 Generating Market Report...")
     
-    response = llm.invoke([HumanMessage(content=prompt)])
+    fetched = []
+    for art in articles:
+        content = get_article_content(art['url'])
+        if content and content['text']:
+            fetched.append({"title": art['title'], "source": art['source'], "text": content['text']})
+
+    if not fetched:
+        return "No valid articles found to generate a report."
+
+    if map_reduce:
+        texts = []
+        for i, art in enumerate(fetched):
+            for chunk in group_chunks(split_markdown(art['text'])):
+                texts.append(f"--- Article {i+1}: {art['title']} ---\nSource: {art['source']}\n{chunk}")
+        map_prompt = (
+            f"Extract the facts relevant to the '{topic}' market from this news excerpt as bullet-point notes. "
+            "Keep company names, figures, dates and the source name. If it has nothing relevant, reply 'None'.\n\n{text}"
+        )
+        report, stats = run_map_reduce(texts, llm, map_prompt, _market_report_prompt(topic, "{notes}"))
+        if user_id:
+            prompt_tokens, completion_tokens = total_usage(stats)
+            log_usage(user_id, "llama-3.3-70b", prompt_tokens, completion_tokens)
+        return report or "No valid articles found to generate a report."
+
+    # Prepare context (packed into a token budget instead of truncating every article)
+    context = pack_articles(fetched, MARKET_TOKEN_BUDGET, query=topic)
+    if not context:
+        return "No valid articles found to generate a report."
+
+    response = llm.invoke([HumanMessage(content=_market_report_prompt(topic, context))])
     
     # Log Usage
     if user_id:
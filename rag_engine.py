@@ -4,10 +4,36 @@ from langchain_community.vectorstores import FAISS
 # NEW: Import local embeddings
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from dotenv import load_dotenv
+from tracing import span
 
 # Load environment variables
 load_dotenv()
 
+def split_markdown(markdown_content: str):
+    """
+    Splits markdown into the ~1000 character chunks used for embedding and map-reduce summarization.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, # Smaller chunks work better for local models
+        chunk_overlap=100,
+        separators=["\n## ", "\n### ", "\n\n", "\n", " ", ""]
+    )
+    return text_splitter.split_text(markdown_content)
+
+_embeddings = None
+
+def get_embeddings():
+    """
+    Returns the local embedding model, loaded once per process.
+    """
+    global _embeddings
+    if _embeddings is None:
+        print("⚙️ Loading local embedding model (all-MiniLM-L6-v2)... this takes a moment initially.")
+        # This downloads a ~80MB model once and runs it on your machine.
+        # It generates vectors without sending data to Google.
+        _embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    return _embeddings
+
 def build_vector_store(markdown_content: str):
     """
     Takes raw markdown, chunks it, embeds it using LOCAL CPU models, 
@@ -16,23 +42,19 @@ def build_vector_store(markdown_content: str):
     print("🧠 Building the paper's brain (running locally on CPU)...")
 
     # 1. Chunking
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, # Smaller chunks work better for local models
-        chunk_overlap=100,
-        separators=["\n## ", "\n### ", "\n\n", "\n", " ", ""]
-    )
-    chunks = text_splitter.split_text(markdown_content)
+    with span("chunk", chars=len(markdown_content)) as s:
+        chunks = split_markdown(markdown_content)
+        s.set("chunks", len(chunks))
     print(f"🧩 Split document into {len(chunks)} chunks.")
 
     # 2. Embedding (The Sovereign Switch)
-    print("⚙️ Loading local embedding model (all-MiniLM-L6-v2)... this takes a moment initially.")
-    
-    # This downloads a ~80MB model once and runs it on your machine.
-    # It generates vectors without sending data to Google.
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    embeddings = get_embeddings()
+    with span("embed", chunks=len(chunks)):
+        vectors = embeddings.embed_documents(chunks)
     
     # Create the vector store
-    vectorstore = FAISS.from_texts(chunks, embedding=embeddings)
+    with span("index_build", chunks=len(chunks)):
+        vectorstore = FAISS.from_embeddings(list(zip(chunks, vectors)), embeddings)
     print("✅ Vector store built and ready in memory.")
     
     return vectorstore
\ No newline at end of file
@@ -1,6 +1,29 @@
 from fpdf import FPDF
+import tempfile
 from docx import Document
+from docx.shared import Inches
 import os
+import hashlib
+from tracing import traced
+
+# Generated exports are cached here, keyed by everything that goes into the document
+EXPORT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "report_exports")
+
+def _cached_export_path(filename: str, content: str, images: list, chart_image: str) -> str:
+    """
+    Output path derived from the report text, the figure files and the chart render,
+    so an unchanged report (e.g. on a Streamlit rerun) maps to the file already written.
+    """
+    digest = hashlib.sha1(content.encode("utf-8"))
+    for path in list(images or []) + ([chart_image] if chart_image else []):
+        try:
+            stat = os.stat(path)
+            digest.update(f"|{path}|{stat.st_mtime}|{stat.st_size}".encode("utf-8"))
+        except OSError:
+            digest.update(f"|{path}|missing".encode("utf-8"))
+    stem, ext = os.path.splitext(filename)
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    return os.path.join(EXPORT_CACHE_DIR, f"{stem}_{digest.hexdigest()[:16]}{ext}")
 
 class PDFReport(FPDF):
     def header(self):
@@ -13,11 +36,19 @@ class PDFReport(FPDF):
         self.set_font('Arial', 'I', 8)
         self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
 
-def generate_pdf(content: str, filename: str = "report.pdf"):
+@traced("export_pdf")
+def generate_pdf(content: str, filename: str = "report.pdf", images: list = None, chart_image: str = None):
     """
     Generates a PDF report from the markdown content.
     Note: Basic markdown parsing.
+    Optional figures (paths from image_tools.collect_report_images) and a static
+    chart render (viz_tools.render_chart_image) are appended after the text.
+    Returns the cached file when the same report was already exported.
     """
+    output_path = _cached_export_path(filename, content, images, chart_image)
+    if os.path.exists(output_path):
+        return output_path
+
     pdf = PDFReport()
     pdf.add_page()
     pdf.set_font("Arial", size=12)
@@ -32,15 +63,38 @@ def generate_pdf(content: str, filename: str = "report.pdf"):
         else:
             # Handle long lines
             pdf.multi_cell(0, 10, line)
+
+    page_width = pdf.w - pdf.l_margin - pdf.r_margin
+    if chart_image:
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, "Data Visualization", 0, 1)
+        pdf.image(chart_image, w=page_width)
+
+    if images:
+        pdf.add_page()
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, "Extracted Figures", 0, 1)
+        for image in images:
+            try:
+                pdf.image(image, w=page_width)
+                pdf.ln(5)
+            except Exception as e:
+                print(f"⚠️ Could not embed {image}: {e}")
+        pdf.set_font("Arial", size=12)
             
-    output_path = os.path.join(tempfile.gettempdir(), filename)
     pdf.output(output_path)
     return output_path
 
-def generate_docx(content: str, filename: str = "report.docx"):
+@traced("export_docx")
+def generate_docx(content: str, filename: str = "report.docx", images: list = None, chart_image: str = None):
     """
     Generates a Word document from the markdown content.
+    Figures and the chart render are appended (and the result cached) like in generate_pdf.
     """
+    output_path = _cached_export_path(filename, content, images, chart_image)
+    if os.path.exists(output_path):
+        return output_path
+
     doc = Document()
     doc.add_heading('Autonomous Research Report', 0)
     
@@ -50,9 +104,18 @@ def generate_docx(content: str, filename: str = "report.docx"):
             doc.add_heading(line.replace('#', '').strip(), level=level)
         else:
             doc.add_paragraph(line)
+
+    if chart_image:
+        doc.add_heading("Data Visualization", level=1)
+        doc.add_picture(chart_image, width=Inches(6))
+
+    if images:
+        doc.add_heading("Extracted Figures", level=1)
+        for image in images:
+            try:
+                doc.add_picture(image, width=Inches(6))
+            except Exception as e:
+                print(f"⚠️ Could not embed {image}: {e}")
             
-    output_path = os.path.join(tempfile.gettempdir(), filename)
     doc.save(output_path)
     return output_path
-
-import tempfile
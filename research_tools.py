@@ -2,6 +2,12 @@ import requests
 import os
 import pymupdf4llm
 import arxiv
+from viz_tools import CHART_SECTION_INSTRUCTIONS
+from db_client import log_usage
+from context_packer import pack_markdown, PRESENTATION_TOKEN_BUDGET
+from rag_engine import split_markdown
+from summarizer import group_chunks, map_reduce as run_map_reduce, total_usage
+from tracing import span, traced, set_attribute
 
 def fetch_and_parse_rich_arxiv(arxiv_id: str, output_dir: str = "paper_content") -> tuple[str, str]:
     # Create specific directory for this paper
@@ -16,17 +22,22 @@ def fetch_and_parse_rich_arxiv(arxiv_id: str, output_dir: str = "paper_content")
     
     if not os.path.exists(pdf_path):
         print(f"⬇️ Downloading paper {arxiv_id}...")
-        response = requests.get(pdf_url)
-        with open(pdf_path, "wb") as f:
-            f.write(response.content)
+        with span("download", arxiv_id=arxiv_id) as s:
+            response = requests.get(pdf_url)
+            with open(pdf_path, "wb") as f:
+                f.write(response.content)
+            s.set("bytes", len(response.content))
     
     print("⚡ Parsing PDF layout...")
-    md_text = pymupdf4llm.to_markdown(
-        pdf_path,
-        write_images=True,
-        image_path=image_path,
-        image_format="png"
-    )
+    with span("parse", arxiv_id=arxiv_id) as s:
+        md_text = pymupdf4llm.to_markdown(
+            pdf_path,
+            write_images=True,
+            image_path=image_path,
+            image_format="png"
+        )
+        s.set("chars", len(md_text))
+        s.set("images", len(os.listdir(image_path)))
     
     # Save a visual copy for you to look at
     with open(os.path.join(paper_dir, f"{arxiv_id}_rich.md"), "w", encoding="utf-8") as f:
@@ -34,11 +45,13 @@ def fetch_and_parse_rich_arxiv(arxiv_id: str, output_dir: str = "paper_content")
         
     return md_text, image_path
 
+@traced("arxiv_search")
 def search_arxiv(topic: str, max_results: int = 5):
     """
     Searches ArXiv for papers related to the topic.
     Returns a list of dictionaries with title, abstract, and id.
     """
+    set_attribute("topic", topic)
     print(f"🔍 Searching ArXiv for: {topic}")
     search = arxiv.Search(
         query=topic,
@@ -55,8 +68,10 @@ def search_arxiv(topic: str, max_results: int = 5):
             "url": result.pdf_url
         })
     
+    set_attribute("results", len(results))
     return results
 
+@traced("select_paper")
 def select_best_paper(topic: str, papers: list, llm):
     """
     Uses the LLM to select the most relevant paper from the list.
@@ -83,4 +98,46 @@ def select_best_paper(topic: str, papers: list, llm):
             return p
             
     # Fallback: return the first one
-    return papers[0]
\ No newline at end of file
+    return papers[0]
+
+def _presentation_prompt(body: str, chart_section: bool) -> str:
+    prompt = (
+        f"Create a structured presentation summary:\n\n{body}\n\n"
+        "Format as:\n# [Title]\n## Key Findings\n- [Point]\n## Methodology\n- [Point]\n## Conclusion\n- [Point]\n\n"
+        "IMPORTANT: Include any specific statistics, numbers, or data points found in the text."
+    )
+    if chart_section:
+        prompt += f"\n\n{CHART_SECTION_INSTRUCTIONS}"
+    return prompt
+
+@traced("presentation")
+def generate_presentation(md_text: str, llm, user_id: str = None, access_token: str = None, chart_section: bool = True, topic: str = None, map_reduce: bool = False):
+    """
+    Generates the structured presentation summary of a parsed paper.
+    The paper is packed into PRESENTATION_TOKEN_BUDGET tokens, favouring sections relevant to the topic.
+    With map_reduce, the whole paper is summarized chunk by chunk instead (see summarizer.map_reduce).
+    With chart_section, the reply ends with a chart-data block; split it off with
+    viz_tools.resolve_chart_data. Pass False when the chart data is already known.
+    """
+    set_attribute("map_reduce", map_reduce)
+    print("💡 Generating Presentation...")
+    if map_reduce:
+        map_prompt = (
+            f"Summarize this excerpt of a research paper{f' on {topic}' if topic else ''} as bullet-point notes. "
+            "Keep every statistic, number, dataset and method name. If it is only references or boilerplate, reply 'None'.\n\n{text}"
+        )
+        chunks = group_chunks(split_markdown(md_text))
+        content, stats = run_map_reduce(chunks, llm, map_prompt, _presentation_prompt("{notes}", chart_section))
+        if user_id:
+            prompt_tokens, completion_tokens = total_usage(stats)
+            log_usage(user_id, "llama-3.3-70b", prompt_tokens, completion_tokens, access_token)
+        return content or "No content could be extracted from this paper."
+
+    response = llm.invoke(_presentation_prompt(pack_markdown(md_text, PRESENTATION_TOKEN_BUDGET, query=topic), chart_section))
+
+    # Log Usage
+    if user_id:
+        usage = response.response_metadata.get('token_usage', {})
+        log_usage(user_id, "llama-3.3-70b", usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), access_token)
+
+    return response.content
@@ -0,0 +1,137 @@
+import os
+import re
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import HumanMessage
+from context_packer import count_tokens
+from tracing import span
+
+# Parallel LLM calls per stage, tokens of source text per map call, and summaries merged per reduce call
+MAP_REDUCE_MAX_CONCURRENCY = int(os.getenv("MAP_REDUCE_MAX_CONCURRENCY", "4"))
+MAP_REDUCE_GROUP_TOKENS = int(os.getenv("MAP_REDUCE_GROUP_TOKENS", "1500"))
+MAP_REDUCE_FAN_IN = int(os.getenv("MAP_REDUCE_FAN_IN", "8"))
+
+# Map prompts ask for 'None' when an excerpt has nothing worth keeping (references, boilerplate)
+_EMPTY_NOTE_RE = re.compile(r"^\W*(none|n/?a|nothing( relevant)?)\W*$", re.IGNORECASE)
+
+_stats_lock = threading.Lock()
+
+def group_chunks(chunks: list, max_tokens: int = MAP_REDUCE_GROUP_TOKENS) -> list:
+    """
+    Merges consecutive splitter chunks into map inputs of at most max_tokens each,
+    so a 40-page paper becomes a handful of map calls instead of one per 1000 characters.
+    """
+    groups = []
+    current, current_tokens = [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(chunk)
+        current_tokens += tokens
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+def _new_stage():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+
+def _invoke(llm, prompt: str, stage: dict) -> str:
+    """
+    Single LLM call with token and latency accounting into the stage dict.
+    """
+    start = time.perf_counter()
+    response = llm.invoke([HumanMessage(content=prompt)])
+    usage = getattr(response, "response_metadata", {}).get('token_usage', {})
+    with _stats_lock:
+        stage["calls"] += 1
+        stage["prompt_tokens"] += usage.get('prompt_tokens', 0)
+        stage["completion_tokens"] += usage.get('completion_tokens', 0)
+        stage["seconds"] += time.perf_counter() - start
+    return response.content
+
+def _run_parallel(llm, prompts: list, stage: dict, max_concurrency: int) -> list:
+    """
+    Runs prompts with at most max_concurrency in flight; results keep the input order.
+    Stage 'seconds' is summed per call, 'wall_seconds' is the elapsed time of the whole stage.
+    """
+    start = time.perf_counter()
+    # Worker threads start with an empty context; give each call a copy of ours so its spans nest here
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        results = list(pool.map(lambda prompt: context.copy().run(_invoke, llm, prompt, stage), prompts))
+    stage["wall_seconds"] = stage.get("wall_seconds", 0.0) + time.perf_counter() - start
+    return results
+
+def _useful_notes(notes: list) -> list:
+    """
+    Drops empty and "None" notes so they are not paid for again in later stages.
+    """
+    return [note.strip() for note in notes if note and note.strip() and not _EMPTY_NOTE_RE.match(note.strip())]
+
+def map_reduce(texts: list, llm, map_prompt: str, final_prompt: str,
+               max_concurrency: int = MAP_REDUCE_MAX_CONCURRENCY, fan_in: int = MAP_REDUCE_FAN_IN):
+    """
+    Summarizes every text in parallel (map), merges the notes in groups of fan_in until
+    they fit one call (reduce), then writes the final output from the merged notes.
+
+    map_prompt must contain a {text} placeholder and final_prompt a {notes} placeholder
+    (plain substitution, so other braces such as JSON examples are left alone).
+    Returns (final_text, stats) where stats has per-stage calls, tokens and latency;
+    final_text is "" (and no final call is made) when every map note came back empty.
+    """
+    stats = {"map": _new_stage(), "reduce": _new_stage(), "final": _new_stage()}
+    start = time.perf_counter()
+
+    print(f"🗺️ Map stage: {len(texts)} calls (max {max_concurrency} in parallel)...")
+    with span("map", calls=len(texts)):
+        notes = _useful_notes(_run_parallel(llm, [map_prompt.replace("{text}", t) for t in texts], stats["map"], max_concurrency))
+    if len(notes) < len(texts):
+        print(f"🗑️ Dropped {len(texts) - len(notes)} empty notes.")
+
+    fan_in = max(2, fan_in)
+    while len(notes) > fan_in:
+        print(f"🧮 Reduce stage: merging {len(notes)} summaries in groups of {fan_in}...")
+        groups = ["\n\n---\n\n".join(notes[i:i + fan_in]) for i in range(0, len(notes), fan_in)]
+        combine_prompts = [
+            "Merge the following research notes into one concise set of notes. "
+            "Remove repetition but keep every statistic, number and named entity.\n\n" + group
+            for group in groups
+        ]
+        with span("reduce", calls=len(combine_prompts)):
+            notes = _useful_notes(_run_parallel(llm, combine_prompts, stats["reduce"], max_concurrency))
+
+    if not notes:
+        stats["total_seconds"] = time.perf_counter() - start
+        print("⚠️ Map-reduce produced no notes; skipping the final call.")
+        return "", stats
+
+    with span("final"):
+        final_text = _invoke(llm, final_prompt.replace("{notes}", "\n\n---\n\n".join(notes)), stats["final"])
+    stats["total_seconds"] = time.perf_counter() - start
+    print(format_stats(stats))
+    return final_text, stats
+
+def format_stats(stats: dict) -> str:
+    """
+    One-line per-stage summary, e.g. for logs.
+    """
+    parts = []
+    for name in ("map", "reduce", "final"):
+        stage = stats[name]
+        if stage["calls"]:
+            parts.append(
+                f"{name}: {stage['calls']} calls, {stage['prompt_tokens']}+{stage['completion_tokens']} tokens, "
+                f"{stage.get('wall_seconds', stage['seconds']):.1f}s"
+            )
+    return f"📈 Map-reduce {stats.get('total_seconds', 0.0):.1f}s ({'; '.join(parts)})"
+
+def total_usage(stats: dict):
+    """
+    Returns (prompt_tokens, completion_tokens) summed over all stages.
+    """
+    stages = [stats[name] for name in ("map", "reduce", "final")]
+    return sum(s["prompt_tokens"] for s in stages), sum(s["completion_tokens"] for s in stages)
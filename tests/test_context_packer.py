@@ -0,0 +1,63 @@
+import random
+
+from context_packer import pack_markdown, pack_articles, count_tokens
+
+WORDS = "model accuracy improves retrieval latency benchmark dataset section encoder corpus".split()
+
+def _paragraph(rng, words=60):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def test_many_sections_still_fill_the_budget():
+    rng = random.Random(2)
+    md = "\n\n".join(f"## {i} Section {i} heading\n{_paragraph(rng)}\n\n{_paragraph(rng)}" for i in range(81))
+
+    packed = pack_markdown(md, 2000)
+
+    assert 0.9 * 2000 <= count_tokens(packed) <= 2000
+
+def test_oversized_results_block_is_split_not_dropped():
+    rng = random.Random(1)
+    results = " ".join(_paragraph(rng, 20) for _ in range(300))
+    md = f"# Paper\n## Abstract\n{_paragraph(rng)}\n\n## 5 Results\n{results}\n\n## References\n[1] A. Author. 2020."
+
+    packed = pack_markdown(md, 2000)
+
+    assert "## 5 Results" in packed
+    assert count_tokens(packed) <= 2000
+
+def test_large_table_pieces_keep_the_header():
+    table = "| Model | Acc |\n|---|---|\n" + "\n".join(f"| m{i} | {i}.5 |" for i in range(800))
+
+    packed = pack_markdown("## Results\n" + table, 300)
+
+    assert packed.count("| Model | Acc |") >= 1
+    assert count_tokens(packed) <= 300
+
+def test_article_that_fits_is_kept_whole():
+    text = "Revenue up 5%.\n\nThe company expects demand to keep growing through next year."
+
+    packed = pack_articles([{"title": "Q3", "source": "News", "text": text}], 2000)
+
+    assert "Revenue up 5%." in packed
+    assert "demand to keep growing" in packed
+
+def test_short_numeric_line_survives_packing():
+    rng = random.Random(3)
+    articles = [
+        {"title": f"Story {i}", "source": "News", "text": "Revenue up 5%.\n\n" + "\n\n".join(_paragraph(rng) for _ in range(10))}
+        for i in range(5)
+    ]
+
+    packed = pack_articles(articles, 1000)
+
+    assert "Revenue up 5%." in packed
+    assert count_tokens(packed) <= 1000
+
+def test_single_blob_article_is_not_packed_to_nothing():
+    rng = random.Random(4)
+    blob = " ".join(_paragraph(rng, 20) for _ in range(400))
+
+    packed = pack_articles([{"title": "Long read", "source": "News", "text": blob}], 500)
+
+    assert "Long read" in packed
+    assert 0 < count_tokens(packed) <= 500
@@ -0,0 +1,129 @@
+import time
+import threading
+
+import pytest
+
+from benchmarks.fakes import FakeLLM
+from llm_governor import RateLimitGovernor, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+
+class FakeClock:
+    """
+    Monotonic clock that only moves when the governor sleeps.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+class RateLimitError(Exception):
+    status_code = 429
+
+class FlakyLLM(FakeLLM):
+    """
+    Answers 429 for the first `failures` calls, then behaves like FakeLLM.
+    """
+
+    def __init__(self, failures: int = 1):
+        super().__init__()
+        self.failures = failures
+
+    def invoke(self, llm_input, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RateLimitError("429 Too Many Requests: rate limit reached")
+        return super().invoke(llm_input, *args, **kwargs)
+
+def _usage(response):
+    usage = response.response_metadata["token_usage"]
+    return usage["prompt_tokens"] + usage["completion_tokens"]
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out waiting for the governor queue")
+        time.sleep(0.005)
+
+def _governor(clock, **kwargs):
+    settings = {"requests_per_minute": 60, "tokens_per_minute": 10000, "max_concurrency": 1}
+    settings.update(kwargs)
+    return RateLimitGovernor(clock=clock, sleep=clock.sleep, **settings)
+
+def test_interactive_call_is_served_before_queued_batch_call():
+    clock = FakeClock()
+    governor = _governor(clock)
+    llm = FakeLLM()
+    served = []
+
+    def invoke(prompt):
+        served.append(prompt)
+        return llm.invoke(prompt)
+
+    # Occupy the only slot so both calls have to queue
+    governor.acquire(100)
+    batch = threading.Thread(target=governor.call, args=(invoke, "batch report"), kwargs={"priority": PRIORITY_BATCH})
+    batch.start()
+    _wait_for(lambda: governor.snapshot()["queue_depth"] == 1)
+    chat = threading.Thread(target=governor.call, args=(invoke, "chat question"), kwargs={"priority": PRIORITY_INTERACTIVE})
+    chat.start()
+    _wait_for(lambda: governor.snapshot()["queue_depth"] == 2)
+
+    governor.release(100)
+    batch.join(5)
+    chat.join(5)
+
+    assert served == ["chat question", "batch report"]
+    assert llm.calls == 2
+
+def test_rate_limited_call_is_retried_until_it_succeeds():
+    clock = FakeClock()
+    governor = _governor(clock, base_delay=2.0)
+    llm = FlakyLLM(failures=2)
+
+    response = governor.call(llm.invoke, "summarize the paper", estimated_tokens=500)
+
+    assert "Key Findings" in response.content
+    metrics = governor.snapshot()
+    assert metrics["rate_limited"] == 2
+    assert metrics["retries"] == 2
+    assert metrics["calls"] == 1
+    assert metrics["failures"] == 0
+    # The 429 emptied the token bucket, so the retry also waited for the refill on the fake clock
+    assert clock.now >= 500 * 60.0 / 10000
+
+def test_under_estimate_goes_into_debt_and_next_call_waits_for_refill():
+    clock = FakeClock()
+    governor = _governor(clock, tokens_per_minute=1000)
+    llm = FakeLLM()
+
+    response = governor.call(llm.invoke, "word " * 700, estimated_tokens=100)
+    used = _usage(response)
+    assert used > 100
+    assert governor.snapshot()["token_bucket"] == pytest.approx(1000 - used, abs=0.1)
+    assert clock.now == 0.0
+
+    # The next reservation does not fit until the bucket has refilled at 1000 tokens/min
+    governor.call(llm.invoke, "short question", estimated_tokens=600)
+    expected_wait = (600 - (1000 - used)) * 60.0 / 1000
+    assert clock.now == pytest.approx(expected_wait, abs=0.05)
+    assert governor.snapshot()["max_wait_seconds"] == pytest.approx(expected_wait, abs=0.05)
+
+def test_over_estimate_is_refunded():
+    clock = FakeClock()
+    governor = _governor(clock, tokens_per_minute=5000)
+    llm = FakeLLM()
+
+    response = governor.call(llm.invoke, "short question", estimated_tokens=3000)
+
+    assert governor.snapshot()["token_bucket"] == pytest.approx(5000 - _usage(response), abs=0.1)
+    assert clock.sleeps == []
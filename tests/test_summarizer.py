@@ -0,0 +1,56 @@
+from benchmarks.fakes import FakeLLM, FakeResponse
+from context_packer import count_tokens
+from summarizer import map_reduce
+
+MAP_PROMPT = "Summarize as notes. If it is only references or boilerplate, reply 'None'.\n\n{text}"
+FINAL_PROMPT = "Write the report from these notes:\n\n{notes}"
+
+class NotesLLM(FakeLLM):
+    """
+    Answers map calls with a note per excerpt ("None" for reference excerpts) and echoes
+    the prompt of later calls so the test can see which notes reached them.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def invoke(self, llm_input, *args, **kwargs):
+        prompt = "\n".join(str(getattr(m, "content", m)) for m in llm_input)
+        self.prompts.append(prompt)
+        self.calls += 1
+        if prompt.startswith("Summarize"):
+            excerpt = prompt.split("\n\n", 1)[1]
+            content = " None. " if excerpt.startswith("References") else f"- note on {excerpt}"
+        else:
+            content = prompt
+        return FakeResponse(content, count_tokens(prompt))
+
+def test_empty_notes_are_not_sent_to_the_final_call():
+    llm = NotesLLM()
+    texts = ["Results: 89.4% accuracy", "References [1] [2] [3]", "Method: dense retrieval", "References [4] [5]"]
+
+    report, stats = map_reduce(texts, llm, MAP_PROMPT, FINAL_PROMPT, max_concurrency=2)
+
+    assert "note on Results" in report and "note on Method" in report
+    assert "None" not in report.split(":", 1)[1]
+    assert stats["map"]["calls"] == 4
+    assert stats["final"]["calls"] == 1
+
+def test_empty_notes_do_not_add_a_reduce_round():
+    llm = NotesLLM()
+    texts = [f"Section {i}: finding {i}" for i in range(3)] + [f"References part {i}" for i in range(6)]
+
+    map_reduce(texts, llm, MAP_PROMPT, FINAL_PROMPT, fan_in=4)
+
+    # 3 useful notes fit one final call: no reduce round despite 9 map outputs
+    assert not any(prompt.startswith("Merge") for prompt in llm.prompts)
+
+def test_all_empty_notes_skip_the_final_call():
+    llm = NotesLLM()
+
+    report, stats = map_reduce(["References [1]", "References [2]"], llm, MAP_PROMPT, FINAL_PROMPT)
+
+    assert report == ""
+    assert stats["final"]["calls"] == 0
+    assert llm.calls == 2
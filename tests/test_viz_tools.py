@@ -0,0 +1,81 @@
+import pytest
+
+from viz_tools import extract_chart_data_locally, validate_chart_data, split_chart_section
+
+RESULTS_TABLE = """## 5 Results
+Table 2: Accuracy on benchmarks
+
+| Model | Params | Accuracy (%) |
+|---|---|---|
+| BERT | 110M | 84.2 |
+| RoBERTa | 125M | 87.1 |
+| Ours | 7B | 89.4 |
+"""
+
+def test_results_table_charts_the_metric_column():
+    chart = extract_chart_data_locally(RESULTS_TABLE)
+
+    assert chart["labels"] == ["BERT", "RoBERTa", "Ours"]
+    assert chart["values"] == [84.2, 87.1, 89.4]
+    assert chart["title"].endswith("Accuracy (%)")
+
+def test_size_column_alone_is_still_charted():
+    text = "| Model | Params |\n|---|---|\n| A | 7B |\n| B | 13B |\n| C | 70B |\n"
+
+    assert extract_chart_data_locally(text)["values"] == [7.0, 13.0, 70.0]
+
+def test_mixed_magnitudes_are_scaled_to_the_largest_unit():
+    text = "## Revenue by region\n| Region | Revenue |\n|---|---|\n| NA | $1.2B |\n| EU | $800M |\n| APAC | $950M |\n"
+
+    assert extract_chart_data_locally(text)["values"] == [1.2, 0.8, 0.95]
+
+def test_list_series_magnitudes_are_scaled():
+    text = "## Segments\n- Cloud: $1.2 billion\n- Edge: $300 million\n- On-prem: $900 million\n"
+
+    assert extract_chart_data_locally(text)["values"] == [1.2, 0.3, 0.9]
+
+def test_incomparable_units_are_skipped():
+    text = "## Mixed\n| Region | Value |\n|---|---|\n| NA | 12% |\n| EU | $800M |\n| APAC | $950M |\n"
+
+    assert extract_chart_data_locally(text) == {}
+
+@pytest.mark.parametrize("text", [
+    "### Training details\n| Setting | Value |\n|---|---|\n| learning rate | 0.001 |\n| batch size | 256 |\n| epochs | 30 |\n",
+    "| Name | Value |\n|---|---|\n| learning rate | 0.001 |\n| batch size | 256 |\n| epochs | 30 |\n",
+])
+def test_hyperparameter_tables_are_not_charted(text):
+    assert extract_chart_data_locally(text) == {}
+
+def test_reference_list_is_not_charted():
+    text = "## References\n1. Vaswani et al. - 2017\n2. Devlin et al. - 2019\n3. Brown et al. - 2020\n4. Raffel et al. - 2020\n"
+
+    assert extract_chart_data_locally(text) == {}
+
+def test_timeline_of_years_is_not_charted():
+    text = "## Funding history\n- Seed: 2015\n- Series A: 2018\n- Series B: 2021\n"
+
+    assert extract_chart_data_locally(text) == {}
+
+def test_years_as_labels_make_a_line_chart():
+    text = "## Market size\n| Year | Revenue |\n|---|---|\n| 2021 | 10 |\n| 2022 | 14 |\n| 2023 | 20 |\n"
+
+    chart = extract_chart_data_locally(text)
+    assert chart["type"] == "line"
+    assert chart["values"] == [10.0, 14.0, 20.0]
+
+def test_percentage_shares_make_a_pie_chart():
+    chart = extract_chart_data_locally("## Market share\n- Cloud: 45%\n- Edge: 30%\n- Other: 25%\n")
+
+    assert chart["type"] == "pie"
+    assert chart["labels"] == ["Cloud", "Edge", "Other"]
+
+@pytest.mark.parametrize("values", [["inf", "1"], [float("nan"), 1], ["-Infinity", 2]])
+def test_non_finite_values_are_rejected(values):
+    assert validate_chart_data({"labels": ["a", "b"], "values": values}) == {}
+
+def test_chart_section_is_split_from_the_report():
+    text = '# Report\nBody\n\n```chart-data\n{"title": "T", "labels": ["A", "B"], "values": [1, "2%"], "type": "pie"}\n```\n'
+
+    report, chart = split_chart_section(text)
+    assert report == "# Report\nBody"
+    assert chart == {"title": "T", "labels": ["A", "B"], "values": [1, 2.0], "type": "pie"}
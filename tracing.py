@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+import functools
+import contextlib
+import contextvars
+from collections import deque, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Opt-in JSONL export of finished spans (e.g. TRACE_FILE=traces.jsonl). When the file grows
+# past TRACE_FILE_MAX_BYTES it is rotated to "<TRACE_FILE>.1", so at most two files are kept.
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+# Histogram buckets (seconds) for the Prometheus stage duration metric
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MAX_RECENT_RUNS = 50
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_runs = deque(maxlen=MAX_RECENT_RUNS)
+_run_spans = {}
+_metrics = defaultdict(lambda: {"count": 0, "errors": 0, "sum": 0.0, "buckets": [0] * len(DURATION_BUCKETS)})
+_token_counters = defaultdict(int)
+_metrics_server = None
+# Spans are serialized by the caller and written by a single background thread
+_export_queue = queue.Queue(maxsize=10000)
+_writer = None
+_dropped_spans = 0
+
+class Span:
+    """
+    One timed stage. Attributes can be added while it runs with set().
+    """
+
+    def __init__(self, name: str, run_id: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.run_id = run_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.duration_ms = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "run_id": self.run_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+def current_span():
+    """
+    The innermost active span in this context, or None outside any span.
+    """
+    return _current_span.get()
+
+def set_attribute(key: str, value):
+    """
+    Adds an attribute to the active span (no-op outside a span).
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.set(key, value)
+
+def _record(finished: Span):
+    seconds = finished.duration_ms / 1000
+    with _lock:
+        metric = _metrics[finished.name]
+        metric["count"] += 1
+        metric["sum"] += seconds
+        if finished.status == "error":
+            metric["errors"] += 1
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                metric["buckets"][i] += 1
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if isinstance(finished.attributes.get(kind), int):
+                _token_counters[(finished.name, kind)] += finished.attributes[kind]
+        if finished.run_id in _run_spans:
+            _run_spans[finished.run_id].append(finished.to_dict())
+
+    if TRACE_FILE:
+        _export(json.dumps(finished.to_dict(), default=str) + "\n")
+
+def _export(line: str):
+    """
+    Queues one JSONL line for the writer thread; never blocks the traced code.
+    """
+    global _writer, _dropped_spans
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name="trace-writer", daemon=True)
+                _writer.start()
+    try:
+        _export_queue.put_nowait(line)
+    except queue.Full:
+        with _lock:
+            _dropped_spans += 1
+
+def _write_loop():
+    while True:
+        lines = [_export_queue.get()]
+        while True:
+            try:
+                lines.append(_export_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) >= TRACE_FILE_MAX_BYTES:
+                os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        except OSError as e:
+            print(f"⚠️ Could not write traces: {e}")
+        finally:
+            for _ in lines:
+                _export_queue.task_done()
+
+def flush_traces(timeout: float = 2.0):
+    """
+    Waits (up to timeout seconds) until queued spans are written to TRACE_FILE.
+    """
+    deadline = time.monotonic() + timeout
+    while _writer is not None and _export_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+atexit.register(flush_traces)
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """
+    Times a pipeline stage: with span("parse", arxiv_id=...) as s: ...; s.set("chunks", n)
+    Spans nest within the current context and belong to the enclosing run (if any).
+    """
+    parent = _current_span.get()
+    s = Span(name, parent.run_id if parent else None, parent.span_id if parent else None, attributes)
+    token = _current_span.set(s)
+    start = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "error"
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        _current_span.reset(token)
+        _record(s)
+
+def traced(name: str):
+    """
+    Decorator form of span() for functions that are one stage end to end;
+    add attributes from inside with set_attribute().
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextlib.contextmanager
+def start_run(name: str, **attributes):
+    """
+    Root span for one pipeline run (e.g. one "Start Autonomous Research" click).
+    Its spans are kept in memory for the timing breakdown; yields the root span (use .run_id).
+    """
+    run_id = uuid.uuid4().hex[:12]
+    with _lock:
+        _run_spans[run_id] = []
+        _runs.append(run_id)
+        # Drop spans of runs that fell out of the recent-runs window
+        for stale in [r for r in _run_spans if r not in _runs]:
+            del _run_spans[stale]
+
+    root = Span(name, run_id, None, attributes)
+    token = _current_span.set(root)
+    start = time.perf_counter()
+    try:
+        yield root
+    except BaseException as e:
+        root.status = "error"
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        root.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        _current_span.reset(token)
+        _record(root)
+
+def run_breakdown(run_id: str) -> list:
+    """
+    Per-stage timing of one run: calls, total and self time (total minus child spans) per span name,
+    slowest self time first. Self times add up to the run duration when stages run sequentially.
+    """
+    with _lock:
+        spans = list(_run_spans.get(run_id, []))
+    child_ms = defaultdict(float)
+    for s in spans:
+        if s["parent_id"]:
+            child_ms[s["parent_id"]] += s["duration_ms"]
+
+    rows = {}
+    for s in spans:
+        row = rows.setdefault(s["name"], {"stage": s["name"], "calls": 0, "total_ms": 0.0, "self_ms": 0.0, "errors": 0})
+        row["calls"] += 1
+        row["total_ms"] += s["duration_ms"]
+        row["self_ms"] += max(0.0, s["duration_ms"] - child_ms[s["span_id"]])
+        row["errors"] += s["status"] == "error"
+    return sorted(rows.values(), key=lambda r: -r["self_ms"])
+
+def recent_runs() -> list:
+    """
+    Root spans of the most recent runs in this process, newest first.
+    """
+    with _lock:
+        spans = [s for run_id in reversed(_runs) for s in _run_spans.get(run_id, []) if s["parent_id"] is None]
+    return spans
+
+def render_prometheus() -> str:
+    """
+    Stage metrics in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP pipeline_stage_duration_seconds Duration of research pipeline stages.",
+        "# TYPE pipeline_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        for name, metric in sorted(_metrics.items()):
+            for bound, count in zip(DURATION_BUCKETS, metric["buckets"]):
+                lines.append(f'pipeline_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'pipeline_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {metric["count"]}')
+            lines.append(f'pipeline_stage_duration_seconds_sum{{stage="{name}"}} {metric["sum"]:.6f}')
+            lines.append(f'pipeline_stage_duration_seconds_count{{stage="{name}"}} {metric["count"]}')
+        lines += ["# HELP pipeline_stage_errors_total Failed pipeline stages.", "# TYPE pipeline_stage_errors_total counter"]
+        for name, metric in sorted(_metrics.items()):
+            lines.append(f'pipeline_stage_errors_total{{stage="{name}"}} {metric["errors"]}')
+        lines += ["# HELP pipeline_llm_tokens_total LLM tokens by stage.", "# TYPE pipeline_llm_tokens_total counter"]
+        for (name, kind), value in sorted(_token_counters.items()):
+            lines.append(f'pipeline_llm_tokens_total{{stage="{name}",kind="{kind}"}} {value}')
+        lines += ["# HELP pipeline_trace_export_dropped_total Spans dropped because the trace writer fell behind.",
+                  "# TYPE pipeline_trace_export_dropped_total counter",
+                  f"pipeline_trace_export_dropped_total {_dropped_spans}"]
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass # Keep scrapes out of the app logs
+
+def start_metrics_server(port: int):
+    """
+    Serves /metrics on a background thread. Safe to call on every Streamlit rerun.
+    """
+    global _metrics_server
+    with _lock:
+        if _metrics_server is not None:
+            return _metrics_server
+        try:
+            _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            print(f"⚠️ Metrics endpoint not started on port {port}: {e}")
+            return None
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        print(f"📈 Metrics endpoint on :{port}/metrics")
+        return _metrics_server
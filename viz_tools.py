@@ -1,8 +1,275 @@
+import os
+import re
 import json
+import math
+import hashlib
+import tempfile
 import plotly.graph_objects as go
 from langchain_core.messages import HumanMessage
 
 from db_client import log_usage
+from context_packer import pack_markdown, CHART_TOKEN_BUDGET
+
+CHART_TYPES = ("bar", "pie", "line")
+
+# Appended to report prompts so the chart data comes back in the same LLM call
+CHART_SECTION_INSTRUCTIONS = (
+    "Finally, after the report, append the most significant numerical data series you used "
+    "(e.g., market share, growth rates, revenue, benchmark scores) as a fenced code block tagged chart-data:\n"
+    "```chart-data\n"
+    '{"title": "Chart Title", "labels": ["Label1", "Label2"], "values": [10, 20], "type": "bar"}\n'
+    "```\n"
+    'Use "pie" or "line" for type when more appropriate. If there is no numerical data, the block must contain {}.'
+)
+
+_CHART_SECTION_RE = re.compile(r"\n*```chart-data\s*(.*?)```\s*", re.DOTALL)
+
+def _to_number(value):
+    if isinstance(value, bool):
+        raise ValueError("booleans are not chart values")
+    if isinstance(value, (int, float)):
+        number = value
+    else:
+        # Accept "45%", "$1,200", "3.5x" style strings
+        number = float(re.sub(r"[,%$€£x\s]", "", str(value)))
+    # NaN/Infinity (as strings or JSON literals) cannot be plotted
+    if not math.isfinite(number):
+        raise ValueError(f"non-finite chart value: {value!r}")
+    return number
+
+def validate_chart_data(data) -> dict:
+    """
+    Checks and normalizes a chart payload.
+    Returns a dict with 'title', 'labels', 'values', 'type', or {} if it is unusable.
+    """
+    if not isinstance(data, dict) or not data:
+        return {}
+    labels = data.get("labels")
+    values = data.get("values")
+    if not isinstance(labels, list) or not isinstance(values, list) or not values or len(labels) != len(values):
+        return {}
+    try:
+        values = [_to_number(v) for v in values]
+    except (TypeError, ValueError):
+        return {}
+
+    chart_type = str(data.get("type", "bar")).lower()
+    return {
+        "title": str(data.get("title") or "Data Visualization"),
+        "labels": [str(label) for label in labels],
+        "values": values,
+        "type": chart_type if chart_type in CHART_TYPES else "bar",
+    }
+
+def parse_chart_json(raw: str):
+    """
+    Parses chart JSON out of an LLM reply, tolerating code fences and surrounding prose.
+    Returns the validated chart dict, {} for an explicit "no data" answer, or None if unparseable.
+    """
+    start, end = raw.find("{"), raw.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        data = json.loads(raw[start:end + 1])
+    except ValueError:
+        return None
+    if data == {}:
+        return {}
+    return validate_chart_data(data) or None
+
+def split_chart_section(text: str):
+    """
+    Separates the chart-data block (see CHART_SECTION_INSTRUCTIONS) from a generated report.
+    Returns (report_text, chart_data); chart_data is None when the block is missing or invalid.
+    """
+    match = _CHART_SECTION_RE.search(text)
+    if not match:
+        return text, None
+    report_text = (text[:match.start()] + "\n" + text[match.end():]).strip()
+    return report_text, parse_chart_json(match.group(1))
+
+_NUMERIC_CELL_RE = re.compile(
+    r"^[$€£]?\s*([-+]?\d[\d,]*(?:\.\d+)?)\s*(%|x|[kmb]|bn|billion|million)?(?:\s*(?:±|\+/-)\s*[\d.]+)?$",
+    re.IGNORECASE,
+)
+_SEPARATOR_ROW_RE = re.compile(r"^\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?$")
+_SERIES_ITEM_RE = re.compile(
+    r"^\s*(?:[-*•]|\d+\.)\s+\**([^:*\n]{2,60}?)\**\s*[:–—-]\s*\**[$€£]?([\d][\d,]*(?:\.\d+)?)\s*(%|billion|million|bn|[kmb])?(?!\w)",
+    re.IGNORECASE,
+)
+_YEAR_RE = re.compile(r"^(19|20)\d{2}$")
+_CHART_KEYWORDS = ("%", "accuracy", "share", "revenue", "growth", "score", "f1", "bleu", "rate", "market", "sales")
+# Training/configuration tables (hyperparameters) and model-size columns are not findings
+_CONFIG_RE = re.compile(
+    r"\b(hyper-?parameters?|config(uration)?s?|settings?|learning rate|lr|batch( size)?|epochs?|dropout|"
+    r"warm-?up|weight decay|optimizer|seed|training steps)\b",
+    re.IGNORECASE,
+)
+_SIZE_RE = re.compile(r"(#|\bparams?\b|\bparameters\b|\bsize\b|\bflops\b|\bnum(ber)? of\b)", re.IGNORECASE)
+_REFERENCE_RE = re.compile(r"\b(references?|bibliography|works cited|citations)\b", re.IGNORECASE)
+_MAGNITUDES = {"k": 1e3, "m": 1e6, "million": 1e6, "b": 1e9, "bn": 1e9, "billion": 1e9}
+
+def _parse_numeric_cell(cell: str):
+    """
+    Returns (value, unit) for cells like "85.3", "**85.3**", "12%", "$1.2B", "71.2 ± 0.4"; None otherwise.
+    """
+    match = _NUMERIC_CELL_RE.match(cell.strip().strip("*_` "))
+    if not match:
+        return None
+    return float(match.group(1).replace(",", "")), (match.group(2) or "").lower()
+
+def _normalize_magnitudes(values: list, units: list):
+    """
+    Rescales a series mixing k/M/B magnitudes ("$1.2B", "$800M") to its largest unit.
+    Returns (values, unit set), or None when the units cannot be compared (e.g. "%" next to "B").
+    """
+    distinct = set(units)
+    if len(distinct) == 1:
+        return values, distinct
+    if not distinct <= set(_MAGNITUDES):
+        return None
+    target = max(distinct, key=lambda unit: _MAGNITUDES[unit])
+    scaled = [round(value * _MAGNITUDES[unit] / _MAGNITUDES[target], 6) for value, unit in zip(values, units)]
+    return scaled, {target}
+
+def _split_row(line: str) -> list:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+def _find_markdown_tables(text: str) -> list:
+    """
+    Finds pipe tables in markdown. Returns (title, header, rows) tuples; the title is the
+    closest heading or "Table ..." caption above the table, or None.
+    """
+    lines = text.splitlines()
+    tables = []
+    i = 0
+    while i < len(lines) - 1:
+        if lines[i].lstrip().startswith("|") and _SEPARATOR_ROW_RE.match(lines[i + 1].strip()):
+            header = _split_row(lines[i])
+            rows = []
+            j = i + 2
+            while j < len(lines) and lines[j].lstrip().startswith("|"):
+                rows.append(_split_row(lines[j]))
+                j += 1
+
+            title = None
+            for k in range(i - 1, max(i - 6, -1), -1):
+                candidate = lines[k].strip().strip("*_ ")
+                if candidate.startswith("#") or candidate.lower().startswith("table"):
+                    title = candidate.lstrip("# ").strip()
+                    break
+            tables.append((title, header, rows))
+            i = j
+        else:
+            i += 1
+    return tables
+
+def _guess_chart_type(labels: list, values: list, units: set) -> str:
+    if all(_YEAR_RE.match(label) for label in labels) and labels == sorted(labels):
+        return "line"
+    if units == {"%"} and 95 <= sum(values) <= 105:
+        return "pie"
+    return "bar"
+
+def _score_candidate(title: str, series_name: str, labels: list, values: list, units: set) -> float:
+    """
+    Heuristic ranking: 3-12 distinct, varied points of a chart-worthy metric score highest.
+    """
+    n = len(values)
+    if n < 2 or len(set(values)) < 2 or len(set(labels)) < n:
+        return 0.0
+    if _CONFIG_RE.search(f"{title} {series_name}") or sum(bool(_CONFIG_RE.search(label)) for label in labels) > n / 2:
+        return 0.0
+    # Reference lists ("Vaswani et al. - 2017") and timelines ("Series B: 2021") are dates, not data
+    if _REFERENCE_RE.search(title) or (units <= {""} and all(v == int(v) and _YEAR_RE.match(str(int(v))) for v in values)):
+        return 0.0
+    score = 1.0 if 3 <= n <= 12 else 0.5
+    if _SIZE_RE.search(series_name):
+        # Parameter counts or dataset sizes: only charted when no metric column exists
+        score -= 0.75
+    elif any(keyword in series_name.lower() for keyword in _CHART_KEYWORDS):
+        score += 0.5
+    elif units & {"%", "b", "bn", "billion", "m", "million"}:
+        score += 0.25
+    elif any(keyword in title.lower() for keyword in _CHART_KEYWORDS):
+        score += 0.25
+    if all(label.strip() for label in labels):
+        score += 0.25
+    return score
+
+def _table_candidates(text: str):
+    for title, header, rows in _find_markdown_tables(text):
+        rows = [row for row in rows if len(row) == len(header)]
+        if len(rows) < 2:
+            continue
+        parsed = [[_parse_numeric_cell(cell) for cell in row] for row in rows]
+
+        # The label column is the first one that is mostly non-numeric
+        label_col = next(
+            (c for c in range(len(header)) if sum(p[c] is None for p in parsed) > len(rows) / 2),
+            None,
+        )
+        if label_col is None and all(_YEAR_RE.match(row[0].strip("*_ ")) for row in rows):
+            label_col = 0
+        if label_col is None:
+            continue
+
+        for col in range(len(header)):
+            if col == label_col:
+                continue
+            points = [(rows[r][label_col].strip("*_ "), parsed[r][col]) for r in range(len(rows)) if parsed[r][col]]
+            if len(points) < 0.8 * len(rows):
+                continue
+            labels = [label for label, _ in points]
+            normalized = _normalize_magnitudes([value for _, (value, _) in points], [unit for _, (_, unit) in points])
+            if normalized is None:
+                continue
+            values, units = normalized
+            series_name = header[col].strip("*_ ")
+            series_title = " - ".join(part for part in (title, series_name) if part)
+            yield series_title or "Data Visualization", series_name, labels, values, units
+
+def _series_candidates(text: str):
+    """
+    Yields runs of list items such as "- Cloud: 45%" or "1. **North America** - $1.2 billion".
+    """
+    labels, values, units = [], [], []
+    heading = ""
+    for line in text.splitlines() + [""]:
+        match = _SERIES_ITEM_RE.match(line)
+        if match:
+            labels.append(match.group(1).strip())
+            values.append(float(match.group(2).replace(",", "")))
+            units.append((match.group(3) or "").lower())
+            continue
+        normalized = _normalize_magnitudes(values, units) if len(labels) >= 3 else None
+        if normalized:
+            yield heading or "Data Visualization", heading, labels, normalized[0], normalized[1]
+        labels, values, units = [], [], []
+        if line.strip().startswith("#"):
+            heading = line.strip().lstrip("# ").strip()
+
+def extract_chart_data_locally(text: str) -> dict:
+    """
+    Deterministic chart extraction: scores markdown tables and percentage/currency list
+    series found in the text and returns the best one in the create_chart format.
+    Returns {} when nothing chart-worthy is found (callers then fall back to the LLM).
+    """
+    if not text:
+        return {}
+
+    best, best_score = None, 0.0
+    for title, series_name, labels, values, units in list(_table_candidates(text)) + list(_series_candidates(text)):
+        score = _score_candidate(title, series_name, labels, values, units)
+        if score > best_score:
+            best_score = score
+            best = {
+                "title": title,
+                "labels": labels,
+                "values": values,
+                "type": _guess_chart_type(labels, values, units),
+            }
+    return validate_chart_data(best)
 
 def extract_data_for_chart(text: str, llm, user_id: str = None, access_token: str = None):
     """
@@ -11,7 +278,7 @@ def extract_data_for_chart(text: str, llm, user_id: str = None, access_token: st
     """
     prompt = (
         f"Analyze the following text and extract any significant numerical data suitable for a chart (e.g., market share, growth rates, revenue).\n\n"
-        f"{text[:4000]}\n\n"
+        f"{pack_markdown(text, CHART_TOKEN_BUDGET)}\n\n"
         "Return ONLY a valid JSON object with the following structure:\n"
         "{\n"
         '  "title": "Chart Title",\n'
@@ -30,19 +297,25 @@ def extract_data_for_chart(text: str, llm, user_id: str = None, access_token: st
             usage = response.response_metadata.get('token_usage', {})
             log_usage(user_id, "llama-3.3-70b", usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), access_token)
 
-        content = response.content.strip()
-        # Clean up potential markdown code blocks
-        if content.startswith("```json"):
-            content = content[7:-3]
-        elif content.startswith("```"):
-            content = content[3:-3]
-            
-        data = json.loads(content)
-        return data
+        return parse_chart_json(response.content) or {}
     except Exception as e:
         print(f"⚠️ Error extracting chart data: {e}")
         return {}
 
+def resolve_chart_data(report_text: str, llm, user_id: str = None, access_token: str = None):
+    """
+    Uses the chart-data block emitted by the report call, then the local table/series
+    extractor; only makes the separate extraction call when both come up empty.
+    Returns (report_text_without_block, chart_data).
+    """
+    report_text, chart_data = split_chart_section(report_text)
+    if chart_data is None:
+        chart_data = extract_chart_data_locally(report_text) or None
+    if chart_data is None:
+        print("📊 No chart section in report, falling back to extraction call...")
+        chart_data = extract_data_for_chart(report_text, llm, user_id, access_token)
+    return report_text, chart_data
+
 def create_chart(data: dict):
     """
     Generates a Plotly figure from the extracted data.
@@ -70,3 +343,29 @@ def create_chart(data: dict):
     except Exception as e:
         print(f"⚠️ Error creating chart: {e}")
         return None
+
+def render_chart_image(fig, output_dir: str = None, width: int = 1000, height: int = 600):
+    """
+    Renders a static JPEG of the chart for PDF/DOCX export (requires kaleido).
+    The render is cached by figure content, so repeated exports reuse the same file.
+    """
+    if fig is None:
+        return None
+
+    # Exports are printed on white paper; re-theme a copy instead of the on-screen dark figure
+    export_fig = go.Figure(fig)
+    export_fig.update_layout(template="plotly_white", paper_bgcolor="white", plot_bgcolor="white")
+
+    output_dir = output_dir or os.path.join(tempfile.gettempdir(), "report_assets")
+    os.makedirs(output_dir, exist_ok=True)
+    key = hashlib.sha1(f"{export_fig.to_json()}|{width}x{height}".encode("utf-8")).hexdigest()
+    output_path = os.path.join(output_dir, f"chart_{key[:16]}.jpg")
+    if os.path.exists(output_path):
+        return output_path
+
+    try:
+        export_fig.write_image(output_path, format="jpg", width=width, height=height)
+        return output_path
+    except Exception as e:
+        print(f"⚠️ Error rendering chart image: {e}")
+        return None